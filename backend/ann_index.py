@@ -0,0 +1,111 @@
+"""
+长演讲稿的近似最近邻索引（完整版 Tracker 使用，纯 NumPy）
+Coarse-to-fine IVF index for relocalizing in very long scripts
+
+追踪丢失（current_idx == -1、脱稿之后，或附近窗口都没有高置信度匹配）时需要全局搜索，
+整本书 / 数小时讲义的演讲稿逐段打分是慢路径。上传时段落数达到 ANN_MIN_SEGMENTS 即构建索引：
+- 粗层：球面 k-means 把归一化向量聚成 nlist 个簇（默认 √n），每个簇存一段连续的段落编号
+- 细层：查询先与簇中心打分，取最相近的 nprobe 个簇，再对簇内段落精确重排
+nprobe 越大召回越高、延迟越高（ANN_NPROBE；bench_ann.py 对比不同 nprobe 与全量扫描）。
+"""
+
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+ANN_MIN_SEGMENTS = int(os.getenv("ANN_MIN_SEGMENTS", "2000"))  # 段落数达到该值才构建索引
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))                   # 簇数，0 表示 √n
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))                 # 每次查询探测的簇数
+ANN_KMEANS_ITERS = int(os.getenv("ANN_KMEANS_ITERS", "10"))
+_ASSIGN_CHUNK = 4096  # 分块计算簇分配，限制临时矩阵大小
+
+
+class IVFIndex:
+    """
+    倒排文件索引：vectors 须为 L2 归一化后的 float32 矩阵（点积即余弦相似度），
+    索引只保存簇中心与按簇排序的段落编号，不复制向量
+    """
+
+    def __init__(self, vectors: np.ndarray, nlist: int = ANN_NLIST, nprobe: int = ANN_NPROBE,
+                 iterations: int = ANN_KMEANS_ITERS, seed: int = 0):
+        self.vectors = vectors
+        n = len(vectors)
+        self.nlist = max(1, min(n, nlist or int(round(math.sqrt(n)))))
+        self.nprobe = max(1, nprobe)
+
+        self.centroids = self._kmeans(vectors, self.nlist, iterations, np.random.default_rng(seed))
+        assignments = self._assign(vectors, self.centroids)
+        self.order = np.argsort(assignments, kind="stable").astype(np.int32)
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=self.nlist), out=self.offsets[1:])
+        self.searches = 0
+
+    def search(self, query: np.ndarray, nprobe: Optional[int] = None) -> Tuple[int, float]:
+        """
+        query 须已归一化；返回 (段落编号, 余弦相似度)，索引为空时返回 (-1, -1)
+        """
+        self.searches += 1
+        nprobe = min(self.nlist, nprobe or self.nprobe)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        if len(candidates) == 0:
+            return -1, -1
+        scores = self.vectors[candidates] @ query
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    @property
+    def nbytes(self) -> int:
+        """索引自身的数组（vectors 与段落存储共用，不计入）"""
+        return self.centroids.nbytes + self.order.nbytes + self.offsets.nbytes
+
+    def stats(self) -> dict:
+        sizes = np.diff(self.offsets)
+        return {
+            "segments": int(len(self.vectors)),
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "max_list_size": int(sizes.max()),
+            "searches": self.searches
+        }
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[i:i + _ASSIGN_CHUNK] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), _ASSIGN_CHUNK)
+        ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def _kmeans(cls, vectors: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+        """球面 k-means：簇中心取均值后重新归一化；空簇用随机段落重新播种"""
+        centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls._assign(vectors, centroids)
+            # 按簇排序后分段求和（比 np.add.at 快得多）
+            counts = np.bincount(assignments, minlength=k)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            empty = counts == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(
+                vectors[np.argsort(assignments, kind="stable")], starts[~empty], axis=0
+            )
+            if empty.any():
+                sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms < 1e-10, 1.0, norms)
+        return centroids.astype(np.float32)
+
+
+def build_index(vectors: np.ndarray, min_segments: int = ANN_MIN_SEGMENTS) -> Optional[IVFIndex]:
+    """段落数达到 min_segments 时构建索引，否则返回 None（调用方全量扫描）"""
+    if len(vectors) < max(1, min_segments):
+        return None
+    return IVFIndex(vectors)
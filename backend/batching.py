@@ -0,0 +1,118 @@
+"""
+跨会话动态微批处理（完整版 main.py 使用）
+Cross-session dynamic micro-batching for utterance embeddings
+
+多位演讲者同时排练时，每条语音都会单独调用一次 model.encode（batch size = 1），
+CPU 吞吐最差。这里把所有连接的语音在几毫秒内收集起来，凑满 N 条或超时后一次性编码，
+再把每条向量分发回各自的调用方（进而交给各自的 Tracker）。
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 批处理参数（可通过环境变量调节）
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "16"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """
+    收集语音文本并批量编码
+    - 第一条请求到达后最多等待 max_wait_ms，或凑满 max_batch_size 条立即发出
+    - 同时在途的批次数不超过推理线程数：线程忙时新请求自然累积成更大的批次
+    """
+
+    def __init__(self, processor, max_batch_size: int = EMBED_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS):
+        self.processor = processor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+    async def embed(self, text: str):
+        """提交一条文本，返回其向量"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.perf_counter()))
+        return await future
+
+    def _ensure_started(self):
+        # 队列与后台任务需要在事件循环内创建
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.processor.inference_workers)
+            self._worker = asyncio.create_task(self._collect_loop())
+
+    async def _collect_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 等到有空闲推理线程再开始收集，忙时请求会在队列中累积
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            asyncio.create_task(self._encode_batch(batch))
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        dispatched = time.perf_counter()
+        self._record(batch, dispatched)
+        try:
+            vectors = await self.processor.aget_embeddings([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            # 按顺序把向量分发回各自的调用方
+            for (_, future, _), vec in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vec)
+        finally:
+            self._slots.release()
+
+    def _record(self, batch, dispatched: float):
+        self._batches += 1
+        self._items += len(batch)
+        self._max_batch = max(self._max_batch, len(batch))
+        for _, _, enqueued in batch:
+            wait = dispatched - enqueued
+            self._total_wait += wait
+            self._max_wait_seen = max(self._max_wait_seen, wait)
+
+    def stats(self) -> Dict[str, float]:
+        """批大小与等待时间统计（用于 /health 上报）"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "batches": self._batches,
+            "items": self._items,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "largest_batch": self._max_batch,
+            "avg_wait_ms": round(self._total_wait / self._items * 1000, 2) if self._items else 0.0,
+            "longest_wait_ms": round(self._max_wait_seen * 1000, 2)
+        }
@@ -0,0 +1,97 @@
+"""
+近似最近邻索引基准测试
+Benchmark the IVF relocalization index against the exhaustive scan
+
+用法（在 backend 目录下运行，只依赖 NumPy）：
+    python bench_ann.py
+    python bench_ann.py --segments 100000 --nprobe 1 4 8 16 32
+    python bench_ann.py --embeddings script_embeddings.npy   # 使用真实演讲稿向量
+
+默认生成带主题结构的合成向量（模拟长篇讲义：同一章节的句子彼此相近），
+查询为段落向量加噪声（模拟口语化复述）。输出：
+- 索引构建耗时、簇数
+- 全量扫描与不同 nprobe 下的单次查询延迟 p50 / p95
+- recall@1（与全量扫描结果一致的比例）
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from ann_index import IVFIndex
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms < 1e-10, 1.0, norms)
+
+
+def _synthetic(segments: int, dim: int, topics: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((topics, dim)).astype(np.float32)
+    labels = np.sort(rng.integers(0, topics, size=segments))  # 章节连续
+    return _normalize(centers[labels] + 0.8 * rng.standard_normal((segments, dim)).astype(np.float32))
+
+
+def _timed(fn, queries):
+    results, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append(fn(q))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比近似最近邻索引与全量扫描")
+    parser.add_argument("--segments", type=int, default=50000, help="合成演讲稿段落数")
+    parser.add_argument("--dim", type=int, default=384, help="向量维度（与 MiniLM 一致）")
+    parser.add_argument("--topics", type=int, default=500, help="合成数据的章节数")
+    parser.add_argument("--embeddings", help="真实向量 .npy 文件（提供时忽略合成参数）")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=0.5, help="查询噪声（相对向量模长）")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=0, help="簇数，0 表示 √n")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        vectors = _normalize(np.load(args.embeddings))
+        print(f"向量: {args.embeddings}（{vectors.shape[0]} 段，{vectors.shape[1]} 维）")
+    else:
+        vectors = _synthetic(args.segments, args.dim, args.topics, rng)
+        print(f"合成向量: {args.segments} 段，{args.dim} 维，{args.topics} 个章节")
+
+    targets = rng.choice(len(vectors), size=args.queries)
+    noise = rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+    queries = _normalize(vectors[targets] + args.noise * _normalize(noise))
+
+    started = time.perf_counter()
+    index = IVFIndex(vectors, nlist=args.nlist)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"索引构建: {build_ms:.0f} ms，nlist={index.nlist}，最大簇 {index.stats()['max_list_size']} 段\n")
+
+    def exhaustive(q):
+        scores = vectors @ q
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    truth, p50, p95 = _timed(exhaustive, queries)
+    truth_ids = np.array([t[0] for t in truth])
+    print(f"{'方式':<14}{'p50 ms':>10}{'p95 ms':>10}{'加速':>10}{'recall@1':>10}")
+    print(f"{'全量扫描':<14}{p50:>10.3f}{p95:>10.3f}{1:>10.1f}{1:>10.1%}")
+
+    for nprobe in args.nprobe:
+        results, ann_p50, ann_p95 = _timed(lambda q: index.search(q, nprobe), queries)
+        recall = float(np.mean(np.array([r[0] for r in results]) == truth_ids))
+        print(f"{f'ivf nprobe={nprobe}':<14}{ann_p50:>10.3f}{ann_p95:>10.3f}{p50 / ann_p50:>10.1f}{recall:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+向量后端对比工具
+Compare embedding backends: latency, resident memory and cosine agreement
+
+用法（在 backend 目录下运行）：
+    python compare_backends.py
+    python compare_backends.py --backends torch int8 onnx --script ../sample_script.txt --repeat 50
+
+每个后端在独立子进程中加载，保证内存统计互不干扰。输出：
+- 加载耗时、加载后常驻内存（RSS）
+- 单句推理延迟（模拟实时语音）p50 / p95，整篇批量编码耗时
+- 与 torch 参考后端的余弦一致性（逐句），以及 Tracker 匹配结果一致率
+"""
+
+import argparse
+import multiprocessing as mp
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from embedding_backends import BACKENDS, load_embedding_model
+from processor import normalize_embeddings
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+REFERENCE_BACKEND = "torch"
+THRESHOLD_HIGH = 0.75  # 与 Tracker.threshold_high 一致
+
+
+def _rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # 非 Linux：退化为峰值 RSS（macOS 单位为字节）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _load_sentences(script_path: str):
+    from processor import ScriptProcessor
+    with open(script_path, encoding="utf-8") as f:
+        # ScriptProcessor 延迟加载模型，这里只用到分句
+        return ScriptProcessor().split_text(f.read())
+
+
+def _run_backend(backend: str, sentences, queries, repeat: int, result_queue):
+    """子进程：加载后端并测量"""
+    try:
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        model = load_embedding_model(MODEL_NAME, backend)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        # 预热一次，排除首次调用的初始化开销
+        model.encode(queries[:1], show_progress_bar=False)
+
+        latencies = []
+        for i in range(repeat):
+            query = queries[i % len(queries)]
+            started = time.perf_counter()
+            model.encode([query], show_progress_bar=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        segment_vecs = model.encode(sentences, show_progress_bar=False)
+        batch_ms = (time.perf_counter() - started) * 1000
+        query_vecs = model.encode(queries, show_progress_bar=False)
+
+        result_queue.put({
+            "backend": backend,
+            "load_ms": load_ms,
+            "rss_mb": _rss_mb(),
+            "model_rss_mb": _rss_mb() - rss_before,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "batch_ms": batch_ms,
+            "segments": np.asarray(segment_vecs, dtype=np.float32),
+            "queries": np.asarray(query_vecs, dtype=np.float32)
+        })
+    except Exception as e:
+        result_queue.put({"backend": backend, "error": str(e)})
+
+
+def _measure(backend, sentences, queries, repeat):
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.Queue()
+    proc = ctx.Process(target=_run_backend, args=(backend, sentences, queries, repeat, result_queue))
+    proc.start()
+    result = result_queue.get()
+    proc.join()
+    return result
+
+
+def _agreement(reference, candidate):
+    """逐句余弦一致性 + Tracker 匹配一致率"""
+    ref_seg = normalize_embeddings(reference["segments"])
+    cand_seg = normalize_embeddings(candidate["segments"])
+    ref_q = normalize_embeddings(reference["queries"])
+    cand_q = normalize_embeddings(candidate["queries"])
+
+    pair_cos = np.sum(ref_seg * cand_seg, axis=1)
+
+    ref_scores = ref_q @ ref_seg.T
+    cand_scores = cand_q @ cand_seg.T
+    same_match = np.argmax(ref_scores, axis=1) == np.argmax(cand_scores, axis=1)
+    same_threshold = (ref_scores.max(axis=1) > THRESHOLD_HIGH) == (cand_scores.max(axis=1) > THRESHOLD_HIGH)
+
+    return {
+        "mean_cos": float(pair_cos.mean()),
+        "min_cos": float(pair_cos.min()),
+        "match_agreement": float(same_match.mean()),
+        "threshold_agreement": float(same_threshold.mean()),
+        "max_score_diff": float(np.abs(ref_scores - cand_scores).max())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比句向量推理后端")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--script", default=str(Path(__file__).parent.parent / "sample_script.txt"))
+    parser.add_argument("--repeat", type=int, default=30, help="单句推理测量次数")
+    args = parser.parse_args()
+
+    sentences = _load_sentences(args.script)
+    # 模拟口语化语音：截取每句的前 2/3
+    queries = [s[:max(4, len(s) * 2 // 3)] for s in sentences]
+    print(f"演讲稿: {args.script}（{len(sentences)} 句）\n")
+
+    backends = [REFERENCE_BACKEND] + [b for b in args.backends if b != REFERENCE_BACKEND]
+    results = {}
+    for backend in backends:
+        print(f"⏳ 测量 {backend} ...")
+        results[backend] = _measure(backend, sentences, queries, args.repeat)
+
+    print(f"\n{'后端':<8}{'加载ms':>10}{'RSS MB':>10}{'模型MB':>10}{'p50 ms':>10}{'p95 ms':>10}{'整篇ms':>10}")
+    for backend, r in results.items():
+        if "error" in r:
+            print(f"{backend:<8}  失败: {r['error']}")
+            continue
+        print(f"{backend:<8}{r['load_ms']:>10.0f}{r['rss_mb']:>10.0f}{r['model_rss_mb']:>10.0f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['batch_ms']:>10.0f}")
+
+    reference = results[REFERENCE_BACKEND]
+    if "error" in reference:
+        return
+
+    print(f"\n与参考后端（{REFERENCE_BACKEND}）的一致性：")
+    print(f"{'后端':<8}{'平均cos':>10}{'最小cos':>10}{'匹配一致':>10}{'阈值一致':>10}{'最大分差':>10}")
+    for backend, r in results.items():
+        if backend == REFERENCE_BACKEND or "error" in r:
+            continue
+        a = _agreement(reference, r)
+        print(f"{backend:<8}{a['mean_cos']:>10.4f}{a['min_cos']:>10.4f}{a['match_agreement']:>10.1%}"
+              f"{a['threshold_agreement']:>10.1%}{a['max_score_diff']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+句向量推理后端（完整版 main.py 使用）
+Selectable embedding backends for ScriptProcessor
+
+同一个 MiniLM 模型的三种运行方式，向量空间一致，Tracker 阈值无需调整：
+- torch：原始全精度 PyTorch（默认，作为参考基准）
+- int8：PyTorch 动态量化，Linear 层权重转为 int8，CPU 上更快、内存更小
+- onnx：ONNX Runtime 推理（需要 sentence-transformers>=3.2 与 onnxruntime），
+        可通过 EMBEDDING_ONNX_FILE 选择模型仓库中预先量化好的 ONNX 文件
+
+通过环境变量 EMBEDDING_BACKEND 选择，用 compare_backends.py 对比延迟、内存与余弦一致性。
+"""
+
+import os
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model.onnx")
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+def load_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND):
+    """
+    按后端加载模型，返回对象均提供 encode(texts, show_progress_bar=False)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        # 动态量化：权重离线转 int8，激活在推理时按批量化
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if backend == "onnx":
+        return SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": EMBEDDING_ONNX_FILE}
+        )
+
+    raise ValueError(f"未知的向量后端: {backend}（可选: {', '.join(BACKENDS)}）")
@@ -0,0 +1,327 @@
+"""
+共享 Gemini 客户端（processor.py、processor_lite.py、main.py、main_lite.py 共用）
+Shared Gemini client with rate limiting, retry and timeouts
+
+- 进程内只配置一次 SDK，按模型名复用 GenerativeModel（共享底层连接）
+- 令牌桶限流：按配额（GEMINI_RPM）平滑请求，突发问答排队等待而不是直接打满配额
+- 429 / RESOURCE_EXHAUSTED 等可重试错误按指数退避（带抖动）重试
+- 每次请求带超时；等待令牌或重试耗尽时抛出 GeminiUnavailable，接口返回 503
+- GEMINI_BACKEND=fake 时使用本地假模型，不访问网络（用于测试与离线演示）
+- 支持服务端上下文缓存（CachedContent）：create_cached_content 创建，bind 得到绑定缓存的客户端
+
+GeminiClient.generate_content 与 SDK 的签名一致，可直接替换原先的 GenerativeModel 对象。
+"""
+
+import asyncio
+import datetime
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_BACKEND = os.getenv("GEMINI_BACKEND", "google")  # google / fake
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))        # 每分钟请求数配额
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))       # 允许的瞬时突发请求数
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_SECONDS = float(os.getenv("GEMINI_BACKOFF_SECONDS", "1.0"))  # 首次退避时长，之后翻倍
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))   # 单次请求超时
+GEMINI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "30"))  # 等待限流令牌的上限
+
+# 视为暂时性故障、值得重试的错误（按异常类名或消息判断，无需导入 google.api_core）
+_RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "DeadlineExceeded", "InternalServerError", "TimeoutError"
+}
+_RETRYABLE_MARKERS = ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE")
+
+
+class GeminiUnavailable(RuntimeError):
+    """限流等待超时或重试耗尽：服务暂时不可用，调用方应返回 503"""
+
+
+_genai = None
+_genai_lock = threading.Lock()
+
+def get_genai():
+    """延迟导入并配置 google.generativeai（只执行一次）"""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def is_retryable(exc: Exception) -> bool:
+    if type(exc).__name__ in _RETRYABLE_NAMES:
+        return True
+    message = str(exc)
+    return any(marker in message for marker in _RETRYABLE_MARKERS)
+
+
+class TokenBucket:
+    """
+    令牌桶（线程安全）：每秒补充 rate 个令牌，最多积累 capacity 个
+    同步线程用 acquire，事件循环内用 acquire_async
+    """
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self) -> float:
+        """尝试取一个令牌：成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_take()
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return round(min(self.capacity, self._tokens + elapsed * self.rate), 2)
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeCachedContent:
+    """本地假上下文缓存"""
+
+    def __init__(self, contents: str, ttl_seconds: float):
+        self.name = "cachedContents/fake-" + hashlib.sha1(contents.encode("utf-8")).hexdigest()[:16]
+        self.expire_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl_seconds)
+
+    def delete(self):
+        pass
+
+
+class FakeGenerativeModel:
+    """本地假模型：根据输入生成确定性的文本，不访问网络"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = " ".join(str(p).strip() for p in parts if isinstance(p, str))
+        text = f"【模拟回答】{prompt[-60:]}"
+        if stream:
+            return iter(_FakeResponse(text[i:i + 8]) for i in range(0, len(text), 8))
+        return _FakeResponse(text)
+
+
+class GeminiClient:
+    """
+    限流 + 重试 + 超时的 Gemini 客户端（线程安全，进程内共享一个实例）
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL, backend: str = GEMINI_BACKEND,
+                 requests_per_minute: float = GEMINI_RPM, burst: int = GEMINI_BURST,
+                 max_retries: int = GEMINI_MAX_RETRIES, backoff_seconds: float = GEMINI_BACKOFF_SECONDS,
+                 timeout_seconds: float = GEMINI_TIMEOUT_SECONDS,
+                 queue_timeout_seconds: float = GEMINI_QUEUE_TIMEOUT_SECONDS):
+        self.model_name = model_name
+        self.backend = backend
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_retries = max(0, max_retries)
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    def model(self, model_name: Optional[str] = None, cached_content=None):
+        """按模型名（或绑定的上下文缓存）复用模型对象"""
+        name = model_name or self.model_name
+        key = f"cached:{cached_content.name}" if cached_content is not None else name
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    if self.backend == "fake":
+                        model = FakeGenerativeModel(name)
+                    elif cached_content is not None:
+                        model = get_genai().GenerativeModel.from_cached_content(cached_content=cached_content)
+                    else:
+                        model = get_genai().GenerativeModel(name)
+                    self._models[key] = model
+        return model
+
+    def generate_content(self, contents, stream: bool = False, model_name: Optional[str] = None,
+                         cached_content=None):
+        """
+        同步调用（在线程中使用）：限流、超时、可重试错误指数退避
+        stream=True 时返回分片迭代器，重试只发生在收到第一个分片之前
+        """
+        if stream:
+            return self._stream(contents, model_name, cached_content)
+        for attempt in range(self.max_retries + 1):
+            self._take_token()
+            try:
+                return self._call(contents, False, model_name, cached_content)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+
+    async def agenerate_content(self, contents, model_name: Optional[str] = None, cached_content=None):
+        """异步调用：限流等待与退避都不阻塞事件循环，请求本身在线程中执行"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            if not await self.bucket.acquire_async(self.queue_timeout_seconds):
+                self._throttled()
+            try:
+                return await loop.run_in_executor(
+                    None, self._call, contents, False, model_name, cached_content
+                )
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+
+    def create_cached_content(self, contents: str, ttl_seconds: float, model_name: Optional[str] = None):
+        """创建服务端上下文缓存（同步，计入限流）"""
+        self._take_token()
+        if self.backend == "fake":
+            return FakeCachedContent(contents, ttl_seconds)
+        get_genai()
+        from google.generativeai import caching
+        name = model_name or self.model_name
+        return caching.CachedContent.create(
+            model=name if name.startswith("models/") else f"models/{name}",
+            contents=[contents],
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+
+    def delete_cached_content(self, cached_content):
+        """删除服务端上下文缓存（失败时忽略，缓存到期也会自动清除）"""
+        with self._lock:
+            self._models.pop(f"cached:{cached_content.name}", None)
+        try:
+            cached_content.delete()
+        except Exception:
+            pass
+
+    def bind(self, cached_content) -> "BoundGeminiClient":
+        """绑定上下文缓存：返回同样提供 generate_content 的对象，可直接传给 stream_answer"""
+        return BoundGeminiClient(self, cached_content)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "backend": self.backend,
+                "model": self.model_name,
+                "tokens_available": self.bucket.available
+            }
+
+    def _stream(self, contents, model_name: Optional[str], cached_content) -> Iterator:
+        for attempt in range(self.max_retries + 1):
+            self._take_token()
+            try:
+                chunks = iter(self._call(contents, True, model_name, cached_content))
+                first = next(chunks, None)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            if first is not None:
+                yield first
+            yield from chunks
+            return
+
+    def _call(self, contents, stream: bool, model_name: Optional[str], cached_content=None):
+        with self._lock:
+            self._stats["requests"] += 1
+        return self.model(model_name, cached_content).generate_content(
+            contents, stream=stream, request_options={"timeout": self.timeout_seconds}
+        )
+
+    def _take_token(self):
+        if not self.bucket.acquire(self.queue_timeout_seconds):
+            self._throttled()
+
+    def _throttled(self):
+        with self._lock:
+            self._stats["throttled"] += 1
+        raise GeminiUnavailable("AI 服务繁忙（请求排队超时），请稍后重试")
+
+    def _on_error(self, exc: Exception, attempt: int) -> float:
+        """记录错误并返回退避秒数；不可重试或重试耗尽时抛出"""
+        if isinstance(exc, GeminiUnavailable):
+            raise exc
+        retryable = is_retryable(exc)
+        with self._lock:
+            if not retryable or attempt >= self.max_retries:
+                self._stats["failures"] += 1
+            else:
+                self._stats["retries"] += 1
+        if not retryable:
+            raise exc
+        if attempt >= self.max_retries:
+            raise GeminiUnavailable(f"AI 服务繁忙（已重试 {self.max_retries} 次）：{exc}") from exc
+        return self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class BoundGeminiClient:
+    """绑定了上下文缓存的客户端视图（共享限流与重试）"""
+
+    def __init__(self, client: GeminiClient, cached_content):
+        self.client = client
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, stream: bool = False):
+        return self.client.generate_content(contents, stream=stream, cached_content=self.cached_content)
+
+    async def agenerate_content(self, contents):
+        return await self.client.agenerate_content(contents, cached_content=self.cached_content)
+
+
+_client: Optional[GeminiClient] = None
+_client_lock = threading.Lock()
+
+def get_gemini_client() -> GeminiClient:
+    """进程内共享的客户端（首次使用时创建）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
+
+def gemini_stats() -> Optional[Dict[str, Any]]:
+    """客户端统计（尚未创建时返回 None，避免 /health 触发 SDK 导入）"""
+    return _client.stats() if _client is not None else None
@@ -0,0 +1,180 @@
+"""
+后台任务队列（main.py 与 main_lite.py 共用）
+Background job queue for long-running uploads
+
+/upload_ppt 不再占用 HTTP 请求等待分析完成：立即返回 job_id，
+分析在有界的后台线程池中执行，客户端通过 /jobs/{id}?since=N 轮询进度和逐页结果。
+- 生命周期：queued -> running -> done / failed，完成的任务保留 JOB_RETENTION_SECONDS 后在下次提交时清理
+- 按会话公平排队：每个会话一条 FIFO 队列，worker 轮流从各会话取任务，单个会话的大批上传不会饿死其他人
+- 任务函数 fn(job) 在线程中运行，通过 set_total / add_partial 汇报进度；
+  结果回写会话的 on_done(job, result) 回到事件循环线程执行，与 WebSocket 处理不会并发修改会话
+"""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))  # 完成后保留 1 小时
+
+
+class Job:
+    """单个后台任务：状态、进度与逐步产生的部分结果（线程安全）"""
+
+    def __init__(self, kind: str, owner: str):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = "queued"  # queued / running / done / failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.total: Optional[int] = None
+        self.partial: List[Any] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._fn: Optional[Callable[["Job"], Any]] = None
+        self._on_done: Optional[Callable[["Job", Any], None]] = None
+
+    def set_total(self, total: int):
+        """设置总步数（例如 PPT 页数）"""
+        with self._lock:
+            self.total = total
+
+    def add_partial(self, item: Any):
+        """追加一条部分结果（例如一页的分析），同时推进进度"""
+        with self._lock:
+            self.partial.append(item)
+
+    def to_dict(self, since: int = 0) -> Dict[str, Any]:
+        """
+        任务状态快照：partial 只返回第 since 条之后的新结果，客户端据此增量拉取
+        """
+        with self._lock:
+            since = max(0, since)
+            now = self.finished_at or time.time()
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": {"done": len(self.partial), "total": self.total},
+                "partial": self.partial[since:],
+                "next_since": len(self.partial),
+                "result": self.result if self.status == "done" else None,
+                "error": self.error,
+                "elapsed_seconds": round(now - (self.started_at or now), 2),
+                "queued_seconds": round((self.started_at or now) - self.created_at, 2)
+            }
+
+
+class JobManager:
+    """
+    有界后台任务池：workers 个并发任务，按 owner（会话）轮转调度
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, retention_seconds: int = JOB_RETENTION_SECONDS):
+        self.workers = max(1, workers)
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()  # owner -> 待执行任务
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def submit(self, kind: str, owner: str, fn: Callable[[Job], Any],
+               on_done: Optional[Callable[[Job, Any], None]] = None) -> Job:
+        """
+        提交任务：fn(job) 在后台线程执行并返回结果；
+        on_done(job, result) 在事件循环线程中执行（可安全修改会话状态）
+        """
+        self._ensure_started()
+        self._prune()
+
+        job = Job(kind, owner)
+        job._fn = fn
+        job._on_done = on_done
+        self._jobs[job.job_id] = job
+        self._queues.setdefault(owner, deque()).append(job)
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def queue_position(self, job: Job) -> int:
+        """估算任务前面还有多少个排队任务（按会话轮转）"""
+        own = self._queues.get(job.owner)
+        if not own or job not in own:
+            return 0
+        rank = list(own).index(job)
+        return rank + sum(
+            min(len(queue), rank + 1)
+            for owner, queue in self._queues.items() if owner != job.owner
+        )
+
+    def stats(self) -> Dict[str, int]:
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "done": statuses.count("done"),
+            "failed": statuses.count("failed")
+        }
+
+    def _ensure_started(self):
+        # 管理器在模块导入时创建，那时还没有运行中的事件循环：首次提交任务时才创建唤醒事件与 worker 协程
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _next_job(self) -> Optional[Job]:
+        """按会话轮转取下一个任务：取出后把该会话移到队尾"""
+        if not self._queues:
+            return None
+        owner, queue = self._queues.popitem(last=False)
+        job = queue.popleft()
+        if queue:
+            self._queues[owner] = queue
+        return job
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                result = await loop.run_in_executor(self._executor, job._fn, job)
+                if job._on_done:
+                    job._on_done(job, result)
+                job.result = result
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job._fn = None
+                job._on_done = None
+
+    def _prune(self):
+        """清理已完成且超过保留期的任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at and now - job.finished_at > self.retention_seconds
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
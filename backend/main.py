@@ -1,26 +1,58 @@
+import time
+
+# 启动耗时统计：从导入 main.py 开始计时
+_IMPORT_STARTED = time.perf_counter()
+
 import os
 import sys
 import asyncio
+import numpy as np
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # 添加backend目录到Python路径
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
-from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, UploadFile, File, WebSocket, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from processor import ScriptProcessor, calculate_similarity
-from tracker import Tracker
-from models import SegmentStatus, ScriptSegment
-import google.generativeai as genai
+from fastapi.responses import JSONResponse, StreamingResponse
+from processor import ScriptProcessor, normalize_embeddings
+from tracker import Tracker, search_stats
+from models import SegmentStatus
+from protocol import UpdateStream
+from speech_stream import SpeechPipeline, speech_stats
+from batching import EmbeddingBatcher
+from sessions import SessionStore
+from jobs import JobManager
+from uploads import save_upload_to_disk
+from gemini_client import GeminiUnavailable, get_gemini_client, gemini_stats
+from qa_stream import stream_answer, stream_cached, SSE_HEADERS
+from qa_cache import SemanticAnswerCache, state_fingerprint
+from prompt_cache import PromptPrefixCache
+from speculative import SpeculativeQA
+from qa_context import (
+    QA_TOP_K, QA_SKIPPED_TOP_K, QA_PPT_TOP_K, QA_ITEM_MAX_CHARS,
+    context_item, top_indices, select_context, format_context, context_stats,
+    estimate_tokens, format_id_ranges
+)
 from dotenv import load_dotenv
-from typing import Dict
+from typing import Dict, Optional
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-app = FastAPI(title="Smart Teleprompter API")
+# 启动后在后台预热模型（设为 0 则完全延迟到首次请求）
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_metrics["startup_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+    if WARMUP_ON_STARTUP:
+        # 放到线程中执行：预热期间 /health、/ready 仍可正常响应
+        asyncio.get_running_loop().run_in_executor(None, processor.warmup)
+    yield
+
+app = FastAPI(title="Smart Teleprompter API", lifespan=lifespan)
 
 # 允许跨域
 app.add_middleware(
@@ -30,19 +62,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局状态存储
+# 全局共享资源（模型、批处理器）
+# 模型在预热或首次请求时才加载，不影响启动速度
+processor = ScriptProcessor()
+
 presentation_data = {
-    "processor": ScriptProcessor(),
-    "tracker": None,
-    "script_content": "",
-    "ppt_analysis": {}
+    "processor": processor,
+    "batcher": EmbeddingBatcher(processor)
 }
 
+# 每位演讲者独立的演讲状态（按 session_id 隔离）
+sessions = SessionStore()
+
+# PPT 分析等耗时任务的后台队列
+jobs = JobManager()
+
+# 问答语义缓存（按会话隔离，演讲状态变化时自动失效）
+qa_cache = SemanticAnswerCache()
+
+# 问答 Prompt 静态前缀缓存（上传演讲稿 / PPT 时创建或刷新）
+prompt_prefixes = PromptPrefixCache()
+
+# 问答预生成（SPECULATIVE_QA=1 开启）：演讲进行中为已讲完 / 跳过的章节预先生成回答
+speculative = SpeculativeQA(processor, qa_cache, lambda session: _qa_fingerprint(session))
+sessions.on_evict(speculative.forget)
+
+def _new_session_data() -> dict:
+    """单个会话保存的演讲状态"""
+    return {
+        "tracker": None,
+        "script_content": "",
+        "ppt_analysis": {},
+        "ppt_page_embeddings": None,
+        "qa_prefix_hash": None
+    }
+
 @app.post("/upload_script")
-async def upload_script(file: UploadFile = File(...)):
+async def upload_script(file: UploadFile = File(...), session_id: Optional[str] = None):
     """
     上传演讲稿并预处理（支持 .txt, .docx 格式，多种编码）
     用户体验优化：返回详细进度信息
+    传入已有 session_id 时替换该会话的演讲稿，否则签发新会话
     """
     try:
         raw_content = await file.read()
@@ -71,36 +131,40 @@ async def upload_script(file: UploadFile = File(...)):
             if content is None:
                 raise HTTPException(status_code=400, detail="无法识别文件编码，请使用 UTF-8 编码或 .docx 格式")
         
-        presentation_data["script_content"] = content
-        
-        processor = presentation_data["processor"]
-        
         # 步骤1：智能分句（支持中英文）
         sentences = processor.split_text(content)
         
         if len(sentences) == 0:
             raise HTTPException(status_code=400, detail="稿件内容为空或格式错误")
         
-        # 步骤2：生成多语言向量
-        embeddings = processor.get_embeddings(sentences)
+        # 步骤2：生成多语言向量（在推理线程池中执行，不阻塞其他连接）
+        embeddings = await processor.aget_embeddings(sentences)
         
-        # 步骤3：构建追踪器
-        segments = [
-            ScriptSegment(
-                id=i,
-                text=text,
-                status=SegmentStatus.PENDING,
-                embedding_idx=i
-            ) for i, text in enumerate(sentences)
-        ]
+        # 步骤3：构建追踪器（段落按列存储，见 segment_store.py；长演讲稿同时构建近似最近邻索引，
+        # 放到线程池执行，不阻塞其他连接）
+        tracker = await asyncio.get_running_loop().run_in_executor(None, Tracker, sentences, embeddings)
         
-        presentation_data["tracker"] = Tracker(segments, embeddings)
+        # 步骤4：保存到会话
+        session = sessions.get(session_id) if session_id else None
+        if session is None:
+            data = _new_session_data()
+            data["script_content"] = content
+            data["tracker"] = tracker
+            session = sessions.create(data)
+        else:
+            session.data["script_content"] = content
+            session.data["tracker"] = tracker
+            sessions.update_memory(session)
+            speculative.forget(session.session_id)
+        _refresh_qa_prefix(session)
         
         return {
             "success": True,
             "message": "演讲稿处理完成",
-            "total_segments": len(segments),
-            "segments": [s.dict() for s in segments],
+            "session_id": session.session_id,
+            "session_memory_bytes": session.memory_bytes,
+            "total_segments": len(sentences),
+            "segments": tracker.state.segments.to_dicts(),
             "preview": sentences[:3]  # 预览前3句
         }
     
@@ -108,114 +172,335 @@ async def upload_script(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 @app.post("/upload_ppt")
-async def upload_ppt(file: UploadFile = File(...)):
+async def upload_ppt(file: UploadFile = File(...), session_id: Optional[str] = None):
     """
     上传 PPT（PDF格式），使用 Gemini 多模态分析
-    用户体验优化：异步处理 + 进度反馈
+    分析放入后台任务队列：立即返回 job_id，通过 /jobs/{job_id} 轮询逐页进度与结果
+    未携带 session_id 时签发新会话（之后上传演讲稿可复用该会话）
     """
     try:
-        # 保存临时文件
-        file_path = f"/tmp/temp_{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        processor = presentation_data["processor"]
-        
-        # 使用 Gemini 深度分析（可能需要几秒）
-        analysis = processor.extract_pdf_with_gemini(file_path)
-        presentation_data["ppt_analysis"] = analysis
-        
-        # 清理临时文件
-        os.remove(file_path)
-        
-        return {
-            "success": True,
-            "message": "PPT 分析完成",
-            "summary": analysis['summary'],
-            "total_pages": len(analysis['pages']),
-            "key_points": analysis['key_points']
-        }
-    
+        # 分块保存临时文件（不在内存中缓冲整个上传）
+        file_path = await save_upload_to_disk(file, suffix=".pdf")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PPT 处理失败: {str(e)}")
+    
+    session = sessions.get(session_id) if session_id else None
+    if session is None:
+        session = sessions.create(_new_session_data())
+    
+    page_vectors = {}
+    
+    def analyze(job):
+        try:
+            # 使用 Gemini 深度分析（逐页渲染，每完成一页汇报一次进度）
+            analysis = processor.extract_pdf_with_gemini(
+                file_path, on_total=job.set_total, on_page=job.add_partial
+            )
+        finally:
+            # 清理临时文件
+            os.remove(file_path)
+        
+        # 预先计算页面向量，问答时按与问题的相关度检索页面
+        page_texts = [page["content"] for page in analysis["pages"]]
+        if page_texts:
+            # 走推理线程池（受 EMBED_CONCURRENCY 限制），不与实时语音的编码并发抢占
+            page_vectors["embeddings"] = normalize_embeddings(
+                processor.submit_embeddings(page_texts).result()
+            )
+        return analysis
+    
+    def on_done(job, analysis):
+        # 在事件循环线程中写回会话（会话可能已被淘汰，此时仅保留任务结果）
+        session.data["ppt_analysis"] = analysis
+        session.data["ppt_page_embeddings"] = page_vectors.get("embeddings")
+        sessions.update_memory(session)
+        _refresh_qa_prefix(session)
+    
+    job = jobs.submit("ppt_analysis", session.session_id, analyze, on_done)
+    return {
+        "success": True,
+        "message": "PPT 已加入分析队列",
+        "session_id": session.session_id,
+        "job_id": job.job_id,
+        "status": job.status,
+        "queue_position": jobs.queue_position(job)
+    }
 
-@app.post("/ask_qa")
-async def ask_qa(question: str):
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, since: int = 0):
     """
-    上下文感知问答
-    核心逻辑：注入演讲状态（Skipped段落警告）
+    后台任务状态：progress 为已完成/总页数，partial 为第 since 条之后新完成的页面分析
     """
-    tracker = presentation_data["tracker"]
-    if not tracker:
-        raise HTTPException(status_code=400, detail="请先上传演讲稿")
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    status = job.to_dict(since)
+    status["queue_position"] = jobs.queue_position(job)
+    return status
 
-    # 构建详细的状态报告
-    covered_parts = []
-    skipped_parts = []
-    pending_parts = []
-    
-    for s in tracker.state.segments:
-        if s.status == SegmentStatus.COVERED:
-            covered_parts.append(s.text)
-        elif s.status == SegmentStatus.SKIPPED:
-            skipped_parts.append(s.text)
-        elif s.status == SegmentStatus.PENDING:
-            pending_parts.append(s.text)
-
-    # PPT 背景
-    ppt_summary = presentation_data["ppt_analysis"].get("summary", "未上传PPT")
+# 问答 Prompt 的固定部分（检索模式与前缀缓存模式共用）
+QA_ROLE = "Role: 演讲辅助专家 - 你正在帮助一位大学生回答教授在 presentation 后的提问。"
+QA_CONSTRAINT = """===== Critical Constraint =====
+如果教授的问题涉及 [SKIPPED] 部分，你必须在回答开头用 ⚠️ 标记并明确提示：
+"⚠️ 这部分内容刚才未讲到，建议您补充说明..."
+
+然后再给出简洁、专业的回答建议。回答需要：
+1. 直接切入重点（不要冗长）
+2. 使用演讲者的口吻
+3. 如果涉及数据或案例，从PPT中引用"""
+
+async def _embed_question(question: str) -> np.ndarray:
+    """问题向量（L2 归一化；走批处理器，与实时语音共享推理线程）"""
+    vec = await presentation_data["batcher"].embed(question)
+    return normalize_embeddings(np.asarray(vec, dtype=np.float32)[None, :])[0]
+
+def _qa_fingerprint(session) -> str:
+    """回答所依据的演讲状态指纹（演讲稿 + 跳过段落 + PPT 摘要）"""
+    segments = session.data["tracker"].state.segments
+    return state_fingerprint(
+        session.data["script_content"],
+        segments.ids_with(SegmentStatus.SKIPPED).tolist(),
+        session.data["ppt_analysis"].get("summary", "")
+    )
+
+def _build_retrieval_prompt(session, question: str, query_vec: np.ndarray):
+    """
+    检索模式的问答 Prompt：按与问题的余弦相似度检索相关段落和 PPT 页面，
+    带状态标签放入提示词（控制在 QA_TOKEN_BUDGET 内），并注入 Skipped 段落警告
+    返回 (prompt, 跳过的段落列表, 上下文统计)
+    """
+    segments = session.data["tracker"].state.segments
+
+    scores = (segments.normed_embeddings @ query_vec).tolist()
+    skipped_ids = segments.ids_with(SegmentStatus.SKIPPED).tolist()
+    covered_count = segments.counts()[SegmentStatus.COVERED]
+    skipped_parts = segments.texts(skipped_ids)
+
+    items = [
+        context_item("segment", i, segments.status_of(i).value.upper(), segments.text(i), scores[i])
+        for i in top_indices(scores, QA_TOP_K)
+    ]
+    # 最相关的跳过段落优先入选，问题涉及跳过内容时模型才能给出 ⚠️ 提醒
+    items += [
+        context_item("segment", i, "SKIPPED", segments.text(i), scores[i], pinned=True)
+        for i in top_indices(scores, QA_SKIPPED_TOP_K, allowed=skipped_ids)
+    ]
+
+    # PPT 页面：使用分析完成时预先计算的页面向量
+    ppt_analysis = session.data["ppt_analysis"]
+    page_embeddings = session.data.get("ppt_page_embeddings")
+    if page_embeddings is not None and len(page_embeddings):
+        pages = ppt_analysis.get("pages", [])
+        page_scores = (page_embeddings @ query_vec).tolist()
+        items += [
+            context_item("page", pages[i]["page"], "PPT", pages[i]["content"], page_scores[i])
+            for i in top_indices(page_scores, QA_PPT_TOP_K)
+        ]
+
+    selected = select_context(items)
+    context = format_context(selected)
+
+    # PPT 背景（整体摘要）
+    ppt_summary = ppt_analysis.get("summary", "未上传PPT")[:QA_ITEM_MAX_CHARS]
     
     # 构建智能 Prompt
     prompt = f"""
-Role: 演讲辅助专家 - 你正在帮助一位大学生回答教授在 presentation 后的提问。
+{QA_ROLE}
 
-===== 演讲进度状态 =====
-已讲内容 (COVERED):
-{chr(10).join(covered_parts) if covered_parts else "尚未开始"}
+===== 演讲进度概况 =====
+共 {len(segments)} 段：已讲 {covered_count} 段，跳过 {len(skipped_ids)} 段，其余未讲
 
-跳过内容 (SKIPPED - 需要特别注意):
-{chr(10).join(skipped_parts) if skipped_parts else "无"}
+===== 与问题相关的演讲内容（按原文顺序，[SKIPPED] 需要特别注意）=====
+{context["segments"]}
 
-未讲内容 (PENDING):
-{chr(10).join(pending_parts) if pending_parts else "已全部完成"}
+===== 相关 PPT 页面 =====
+{context["pages"]}
 
 ===== PPT 背景信息 =====
 {ppt_summary}
 
-===== Critical Constraint =====
-如果教授的问题涉及 [SKIPPED] 部分，你必须在回答开头用 ⚠️ 标记并明确提示：
-"⚠️ 这部分内容刚才未讲到，建议您补充说明..."
+{QA_CONSTRAINT}
 
-然后再给出简洁、专业的回答建议。回答需要：
-1. 直接切入重点（不要冗长）
-2. 使用演讲者的口吻
-3. 如果涉及数据或案例，从PPT中引用
+===== 教授的问题 =====
+"{question}"
+
+请给出回答建议：
+"""
+    return prompt, skipped_parts, context_stats(selected, prompt)
+
+def _qa_static_prefix(session) -> str:
+    """
+    问答 Prompt 的静态前缀：角色与约束、带编号的演讲稿全文、PPT 分析
+    只在上传演讲稿 / PPT 时变化，可整体缓存
+    """
+    segments = session.data["tracker"].state.segments
+    ppt_analysis = session.data["ppt_analysis"]
+    script_lines = "\n".join(f"[#{i}] {text}" for i, text in enumerate(segments.texts()))
+    page_lines = "\n".join(
+        f"[PPT 第{page['page']}页] {page['content']}" for page in ppt_analysis.get("pages", [])
+    )
+    return f"""
+{QA_ROLE}
+
+===== 演讲稿全文（[#编号] 对应下方进度中的段落编号）=====
+{script_lines}
+
+===== PPT 背景信息 =====
+{ppt_analysis.get("summary", "未上传PPT")}
+{page_lines}
+
+{QA_CONSTRAINT}
+"""
+
+def _qa_dynamic_suffix(session, question: str):
+    """问答 Prompt 的动态后缀：演讲进度与问题，返回 (后缀, 跳过的段落列表)"""
+    segments = session.data["tracker"].state.segments
+    covered_ids = segments.ids_with(SegmentStatus.COVERED).tolist()
+    skipped_ids = segments.ids_with(SegmentStatus.SKIPPED).tolist()
+    suffix = f"""
+===== 演讲进度状态 =====
+已讲段落 (COVERED): {format_id_ranges(covered_ids)}
+跳过段落 (SKIPPED - 需要特别注意): {format_id_ranges(skipped_ids)}
+其余段落尚未讲到 (PENDING)
 
 ===== 教授的问题 =====
 "{question}"
 
 请给出回答建议：
 """
+    return suffix, segments.texts(skipped_ids)
+
+def _refresh_qa_prefix(session):
+    """上传演讲稿 / PPT 后登记新的静态前缀（服务端缓存在后台创建）"""
+    if session.data["tracker"] is None:
+        return
+    session.data["qa_prefix_hash"] = prompt_prefixes.refresh_async(
+        session.session_id, _qa_static_prefix(session)
+    )
+
+def _build_qa_prompt(session, question: str, query_vec: np.ndarray):
+    """
+    构建问答 Prompt，返回 (prompt, 跳过的段落列表, 上下文统计, 服务端缓存或 None)
+    - 静态前缀已在服务端缓存：只发送动态后缀
+    - 前缀较短：发送“相同前缀 + 后缀”（命中隐式前缀缓存）
+    - 其余情况（缓存未就绪或不可用）：退回检索模式
+    """
+    entry = prompt_prefixes.lookup(session.session_id, session.data.get("qa_prefix_hash"))
+    if entry is None or entry.mode == "retrieval":
+        prompt, skipped_parts, context = _build_retrieval_prompt(session, question, query_vec)
+        return prompt, skipped_parts, {**context, "mode": "retrieval"}, None
+
+    suffix, skipped_parts = _qa_dynamic_suffix(session, question)
+    if entry.mode == "provider":
+        prompt, cached_content = suffix, entry.cached_content
+    else:
+        prompt, cached_content = entry.prefix + suffix, None
+    context = {
+        "mode": entry.mode,
+        "prompt_tokens": estimate_tokens(prompt),
+        "prefix_tokens": entry.prefix_tokens
+    }
+    return prompt, skipped_parts, context, cached_content
+
+def _resolve_qa_session(session_id: Optional[str]):
+    session = sessions.resolve(session_id)
+    if not session or not session.data["tracker"]:
+        raise HTTPException(status_code=400, detail="请先上传演讲稿")
+    return session
+
+@app.post("/ask_qa")
+async def ask_qa(question: str, session_id: Optional[str] = None):
+    """
+    上下文感知问答
+    核心逻辑：注入演讲状态（Skipped段落警告）
+    相同或近似的问题在演讲状态未变时直接返回缓存的回答
+    """
+    session = _resolve_qa_session(session_id)
+    query_vec = await _embed_question(question)
+    fingerprint = _qa_fingerprint(session)
+
+    cached = qa_cache.lookup(session.session_id, fingerprint, query_vec)
+    if cached:
+        return {
+            "success": True,
+            "answer": cached["answer"],
+            **cached["meta"],
+            "cached": True,
+            "cache_similarity": cached["similarity"]
+        }
+
+    prompt, skipped_parts, context, cached_content = _build_qa_prompt(session, question, query_vec)
 
     try:
-        # 使用最新的 Gemini 2.5 Flash 模型生成回答
-        gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-        response = gemini_model.generate_content(prompt)
+        # 共享客户端（Gemini 2.5 Flash）：限流等待与重试退避不阻塞事件循环
+        with speculative.foreground():
+            response = await get_gemini_client().agenerate_content(prompt, cached_content=cached_content)
         
         answer = response.text
+        meta = {
+            "has_skipped_content": len(skipped_parts) > 0,
+            "skipped_count": len(skipped_parts),
+            "context": context
+        }
+        qa_cache.store(session.session_id, fingerprint, query_vec, answer, meta)
         
         return {
             "success": True,
             "answer": answer,
-            "has_skipped_content": len(skipped_parts) > 0,
-            "skipped_count": len(skipped_parts)
+            **meta,
+            "cached": False
         }
     
+    except GeminiUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI 回答失败: {str(e)}")
+
+@app.post("/ask_qa/stream")
+async def ask_qa_stream(question: str, session_id: Optional[str] = None):
+    """
+    流式问答（SSE）：先发送 meta（含 has_skipped_content），再逐段推送回答
+    结束事件 done 中分别给出首字延迟 ttft_ms 与总耗时 total_ms
+    """
+    session = _resolve_qa_session(session_id)
+    query_vec = await _embed_question(question)
+    fingerprint = _qa_fingerprint(session)
+
+    cached = qa_cache.lookup(session.session_id, fingerprint, query_vec)
+    if cached:
+        meta = {**cached["meta"], "cached": True, "cache_similarity": cached["similarity"]}
+        return StreamingResponse(
+            stream_cached(cached["answer"], meta),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+
+    prompt, skipped_parts, context, cached_content = _build_qa_prompt(session, question, query_vec)
+    meta = {
+        "has_skipped_content": len(skipped_parts) > 0,
+        "skipped_count": len(skipped_parts),
+        "context": context
+    }
+    try:
+        gemini_client = get_gemini_client()
+        if cached_content is not None:
+            gemini_client = gemini_client.bind(cached_content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI 回答失败: {str(e)}")
+    return StreamingResponse(
+        speculative.guard_stream(stream_answer(
+            gemini_client, prompt, {**meta, "cached": False},
+            on_complete=lambda answer: qa_cache.store(
+                session.session_id, fingerprint, query_vec, answer, meta
+            )
+        )),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
 @app.websocket("/ws/speech")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None,
+                             encoding: str = "json"):
     """
     实时语音追踪 WebSocket
     用户体验优化：
@@ -224,8 +509,9 @@ async def websocket_endpoint(websocket: WebSocket):
     3. 错误恢复机制
     """
     await websocket.accept()
-    tracker = presentation_data["tracker"]
-    processor = presentation_data["processor"]
+    session = sessions.resolve(session_id)
+    tracker = session.data["tracker"] if session else None
+    batcher = presentation_data["batcher"]
     
     if not tracker:
         await websocket.send_json({
@@ -234,41 +520,64 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close()
         return
     
-    try:
-        while True:
-            data = await websocket.receive_json()
-            speech_text = data.get("text", "").strip()
-            
-            if not speech_text:
-                continue
-            
-            # 实时向量化并匹配
-            vec = processor.get_embeddings([speech_text])[0]
-            new_state = tracker.process_speech_vector(vec)
-            
-            # 推送更新（只发送必要信息，减少延迟）
-            response = {
-                "current_idx": new_state.current_idx,
-                "is_free_style": new_state.is_free_style,
-                "segments": [
-                    {
-                        "id": s.id,
-                        "status": s.status.value,
-                        "text": s.text
-                    } for s in new_state.segments
-                ]
-            }
-            
-            await websocket.send_json(response)
+    # 增量推送：连接时发送一次完整演讲稿，之后只发送变化
+    stream = UpdateStream(tracker.journal, tracker.state.segments.to_dicts)
     
-    except WebSocketDisconnect:
-        print("WebSocket disconnected")
-    except Exception as e:
-        await websocket.send_json({"error": str(e)})
-        await websocket.close()
+    async def match(text: str, is_final: bool):
+        sessions.touch(session)
+        # 实时向量化并匹配（与其他连接的语音合并成批次编码）
+        vec = await batcher.embed(text)
+        tracker.process_speech_vector(vec, is_final)
+        speculative.observe(session)
+    
+    # 接收、匹配、发送并发执行（只推送位置和状态变化，减少延迟和流量）
+    await SpeechPipeline(
+        websocket, stream,
+        lambda: (tracker.state.current_idx, tracker.state.is_free_style),
+        match, session_id=session.session_id, encoding=encoding
+    ).run()
+
+@app.get("/sessions")
+async def session_stats():
+    """会话数量与每个会话的内存占用"""
+    return sessions.stats()
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    就绪检查（与 /health 分离）：模型加载完成前返回 503，并上报预热进度
+    """
+    ready = processor.is_ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "warmup": processor.warmup_status,
+            "import_seconds": startup_metrics["import_seconds"],
+            "startup_seconds": startup_metrics["startup_seconds"],
+            "first_inference_ms": processor.first_inference_ms
+        }
+    )
 
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "ok", "service": "Smart Teleprompter"}
+    return {
+        "status": "ok",
+        "service": "Smart Teleprompter",
+        "inference": presentation_data["processor"].inference_stats(),
+        "batching": presentation_data["batcher"].stats(),
+        "jobs": jobs.stats(),
+        "qa_cache": qa_cache.stats(),
+        "gemini": gemini_stats(),
+        "prompt_prefix_cache": prompt_prefixes.stats(),
+        "speculative_qa": speculative.stats(),
+        "speech": speech_stats(),
+        "tracking": search_stats()
+    }
 
+# 模块导入耗时（不含模型加载）
+startup_metrics = {
+    "import_seconds": round(time.perf_counter() - _IMPORT_STARTED, 3),
+    "startup_seconds": None
+}
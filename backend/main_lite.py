@@ -5,20 +5,30 @@ Smart Teleprompter - Lightweight Deployment Version
 此文件用于快速部署，移除了大型依赖
 """
 
+import asyncio
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
-import google.generativeai as genai
+from text_index import ScriptIndex, normalize_text
+from protocol import StatusJournal, UpdateStream
+from speech_stream import SpeechPipeline, speech_stats
+from sessions import SessionStore
+from jobs import JobManager
+from uploads import save_upload_to_disk
+from gemini_client import GeminiUnavailable, get_gemini_client, gemini_stats
+from qa_stream import stream_answer, SSE_HEADERS
+from qa_context import (
+    QA_TOP_K, QA_SKIPPED_TOP_K, QA_ITEM_MAX_CHARS,
+    context_item, top_indices, select_context, format_context, context_stats,
+    estimate_tokens, format_id_ranges
+)
+from prompt_cache import PromptPrefixCache
+from typing import Optional
 
 load_dotenv()
 
-# 安全配置 API Key
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
-
 app = FastAPI(title="Smart Teleprompter API - Lite")
 
 # 允许跨域
@@ -29,14 +39,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局状态
-presentation_data = {
-    "script_content": "",
-    "segments": [],
-    "ppt_analysis": {},
-    "current_idx": -1,
-    "is_free_style": False
-}
+# 每位演讲者独立的演讲状态（按 session_id 隔离）
+sessions = SessionStore()
+
+# PPT 分析等耗时任务的后台队列
+jobs = JobManager()
+
+# 问答 Prompt 静态前缀缓存（上传演讲稿 / PPT 时创建或刷新）
+prompt_prefixes = PromptPrefixCache()
+
+def _new_session_data() -> dict:
+    """单个会话保存的演讲状态"""
+    return {
+        "script_content": "",
+        "segments": [],
+        "index": None,
+        "journal": StatusJournal(),
+        "ppt_analysis": {},
+        "current_idx": -1,
+        "is_free_style": False,
+        "qa_prefix_hash": None
+    }
 
 @app.get("/")
 async def root():
@@ -56,12 +79,24 @@ async def health_check():
         "service": "Smart Teleprompter Lite",
         "version": "1.0",
         "api_key_configured": bool(api_key),
-        "api_key_preview": f"{api_key[:10]}..." if api_key else "not set"
+        "api_key_preview": f"{api_key[:10]}..." if api_key else "not set",
+        "jobs": jobs.stats(),
+        "gemini": gemini_stats(),
+        "prompt_prefix_cache": prompt_prefixes.stats(),
+        "speech": speech_stats()
     }
 
+@app.get("/sessions")
+async def session_stats():
+    """会话数量与每个会话的内存占用"""
+    return sessions.stats()
+
 @app.post("/upload_script")
-async def upload_script(file: UploadFile = File(...)):
-    """上传演讲稿（支持 .txt, .doc, .docx 格式）"""
+async def upload_script(file: UploadFile = File(...), session_id: Optional[str] = None):
+    """
+    上传演讲稿（支持 .txt, .doc, .docx 格式）
+    传入已有 session_id 时替换该会话的演讲稿，否则签发新会话
+    """
     try:
         raw_content = await file.read()
         filename = file.filename.lower()
@@ -90,23 +125,43 @@ async def upload_script(file: UploadFile = File(...)):
             if content is None:
                 raise HTTPException(status_code=400, detail="无法识别文件编码，请使用 UTF-8 编码或 .docx 格式")
         
-        presentation_data["script_content"] = content
-        
         # 简单分句
         import re
         pattern = r'(?<=[。！？；])|(?<=[.!?;])(?=\s|$)'
         sentences = [s.strip() for s in re.split(pattern, content) if len(s.strip()) > 3]
         
-        presentation_data["segments"] = [
+        # 预构建匹配索引（拼接文本 + 三字组位置数组），避免每次语音都重新处理全文；
+        # 在线程池中构建，不阻塞其他连接的实时追踪
+        index = await asyncio.get_running_loop().run_in_executor(None, ScriptIndex, sentences)
+        
+        session = sessions.get(session_id) if session_id else None
+        data = session.data if session else _new_session_data()
+        
+        # 新演讲稿：重置追踪状态
+        data["script_content"] = content
+        data["segments"] = [
             {"id": i, "text": text, "status": "pending"}
             for i, text in enumerate(sentences)
         ]
+        data["current_idx"] = -1
+        data["is_free_style"] = False
+        
+        data["index"] = index
+        data["journal"] = StatusJournal()
+        
+        if session is None:
+            session = sessions.create(data)
+        else:
+            sessions.update_memory(session)
+        _refresh_qa_prefix(session)
         
         return {
             "success": True,
             "message": "演讲稿处理完成",
+            "session_id": session.session_id,
+            "session_memory_bytes": session.memory_bytes,
             "total_segments": len(sentences),
-            "segments": presentation_data["segments"],
+            "segments": data["segments"],
             "preview": sentences[:3]
         }
     
@@ -114,95 +169,228 @@ async def upload_script(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"处理失败: {str(e)}")
 
 @app.post("/upload_ppt")
-async def upload_ppt(file: UploadFile = File(...)):
-    """上传 PPT（PDF格式）"""
+async def upload_ppt(file: UploadFile = File(...), session_id: Optional[str] = None):
+    """
+    上传 PPT（PDF格式）
+    提取与摘要放入后台任务队列：立即返回 job_id，通过 /jobs/{job_id} 轮询进度与结果
+    未携带 session_id 时签发新会话（之后上传演讲稿可复用该会话）
+    """
     try:
-        # 保存临时文件
-        file_path = f"/tmp/temp_{file.filename}"
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # 使用 PyMuPDF 提取文本
+        from processor_lite import extract_pdf_text, PROMPT_TEXT_BUDGET
+    except ImportError:
+        raise HTTPException(status_code=500, detail="PDF 处理库未安装")
+    
+    try:
+        # 分块保存临时文件（不在内存中缓冲整个上传）
+        file_path = await save_upload_to_disk(file, suffix=".pdf")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PPT 处理失败: {str(e)}")
+    
+    session = sessions.get(session_id) if session_id else None
+    if session is None:
+        session = sessions.create(_new_session_data())
+    
+    def analyze(job):
+        # 两步：文本提取 → Gemini 摘要，每步完成后汇报一次进度
+        job.set_total(2)
         try:
-            import fitz
-            doc = fitz.open(file_path)
-            all_text = ""
-            for page in doc:
-                all_text += page.get_text()
-            doc.close()
-            
-            # 使用 Gemini 分析
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            prompt = f"""
-            这是一份演讲 PPT 的文本内容，请提取：
-            1. 整体主题
-            2. 3-5个核心论点
-            
-            内容：
-            {all_text[:3000]}
-            """
-            response = model.generate_content(prompt)
-            
-            presentation_data["ppt_analysis"] = {
-                "summary": response.text,
-                "raw_text": all_text[:1000]
-            }
-            
+            # 按页提取，提示词预算用完即停止
+            extracted = extract_pdf_text(file_path, max_chars=PROMPT_TEXT_BUDGET)
+        finally:
             os.remove(file_path)
-            
-            return {
-                "success": True,
-                "message": "PPT 分析完成",
-                "summary": response.text
-            }
+        all_text = extracted["text"]
+        job.add_partial({"step": "extract", "extract_stats": extracted["stats"]})
+        
+        # 使用 Gemini 分析（共享客户端：限流 + 重试）
+        prompt = f"""
+        这是一份演讲 PPT 的文本内容，请提取：
+        1. 整体主题
+        2. 3-5个核心论点
         
-        except ImportError:
-            raise HTTPException(status_code=500, detail="PDF 处理库未安装")
+        内容：
+        {all_text}
+        """
+        response = get_gemini_client().generate_content(prompt)
+        job.add_partial({"step": "summary", "summary": response.text})
+        
+        return {
+            "summary": response.text,
+            "raw_text": all_text[:1000],
+            "extract_stats": extracted["stats"]
+        }
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PPT 处理失败: {str(e)}")
+    def on_done(job, analysis):
+        # 在事件循环线程中写回会话（会话可能已被淘汰，此时仅保留任务结果）
+        session.data["ppt_analysis"] = analysis
+        sessions.update_memory(session)
+        _refresh_qa_prefix(session)
+    
+    job = jobs.submit("ppt_analysis", session.session_id, analyze, on_done)
+    return {
+        "success": True,
+        "message": "PPT 已加入分析队列",
+        "session_id": session.session_id,
+        "job_id": job.job_id,
+        "status": job.status,
+        "queue_position": jobs.queue_position(job)
+    }
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, since: int = 0):
+    """
+    后台任务状态：progress 为已完成/总步数，partial 为第 since 条之后新完成的步骤
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    status = job.to_dict(since)
+    status["queue_position"] = jobs.queue_position(job)
+    return status
+
+# 有跳过段落时附加在回答开头的提示
+SKIPPED_NOTICE = "⚠️ 提示：演讲中有部分内容被跳过，如果问题涉及这些内容，建议补充说明。\n\n"
+
+def _build_retrieval_prompt(data: dict, question: str):
+    """
+    检索模式的问答 Prompt：按 BM25 检索与问题相关的段落，带状态标签放入提示词
+    （控制在 QA_TOKEN_BUDGET 内），返回 (prompt, 是否有跳过的段落, 上下文统计)
+    """
+    ppt_summary = data.get("ppt_analysis", {}).get("summary", "")[:QA_ITEM_MAX_CHARS]
+    segments = data.get("segments", [])
+    index = data.get("index")
+    
+    # 检查是否有跳过的段落
+    skipped_ids = [i for i, s in enumerate(segments) if s.get("status") == "skipped"]
+    has_skipped = len(skipped_ids) > 0
+    
+    items = []
+    if index is not None and segments:
+        scores = [0.0] * len(segments)
+        for doc_id, score in index.search(normalize_text(question)):
+            scores[doc_id] = score
+        items = [
+            context_item("segment", i, segments[i]["status"].upper(), segments[i]["text"], scores[i])
+            for i in top_indices(scores, QA_TOP_K) if scores[i] > 0
+        ]
+        # 最相关的跳过段落优先入选，问题涉及跳过内容时模型才能提醒
+        items += [
+            context_item("segment", i, "SKIPPED", segments[i]["text"], scores[i], pinned=True)
+            for i in top_indices(scores, QA_SKIPPED_TOP_K, allowed=skipped_ids)
+        ]
+    selected = select_context(items)
+    
+    prompt = f"""
+    你是一位演讲辅助专家。
+
+    与问题相关的演讲稿段落（[SKIPPED] 为演讲中跳过的内容）：
+    {format_context(selected)["segments"]}
+    PPT摘要：{ppt_summary}
+    
+    教授的问题：{question}
+    
+    请给出简洁、专业的回答建议。
+    """
+    return prompt, has_skipped, {**context_stats(selected, prompt), "mode": "retrieval"}
+
+def _qa_static_prefix(data: dict) -> str:
+    """问答 Prompt 的静态前缀：带编号的演讲稿全文与 PPT 摘要，只在上传时变化"""
+    script_lines = "\n".join(f"[#{s['id']}] {s['text']}" for s in data["segments"])
+    return f"""
+    你是一位演讲辅助专家。
+
+    演讲稿全文（[#编号] 对应下方的段落编号）：
+    {script_lines}
+    PPT摘要：{data.get("ppt_analysis", {}).get("summary", "")}
+    """
+
+def _refresh_qa_prefix(session):
+    """上传演讲稿 / PPT 后登记新的静态前缀（服务端缓存在后台创建）"""
+    if not session.data["segments"]:
+        return
+    session.data["qa_prefix_hash"] = prompt_prefixes.refresh_async(
+        session.session_id, _qa_static_prefix(session.data)
+    )
+
+def _build_qa_prompt(session_id: Optional[str], question: str):
+    """
+    构建问答 Prompt，返回 (prompt, 是否有跳过的段落, 上下文统计, 服务端缓存或 None)
+    静态前缀已缓存时只发送动态后缀（跳过的段落编号 + 问题），否则退回检索模式
+    """
+    session = sessions.resolve(session_id)
+    data = session.data if session else _new_session_data()
+    
+    entry = prompt_prefixes.lookup(session.session_id, data["qa_prefix_hash"]) if session else None
+    if entry is None or entry.mode == "retrieval":
+        return (*_build_retrieval_prompt(data, question), None)
+    
+    skipped_ids = [s["id"] for s in data["segments"] if s.get("status") == "skipped"]
+    suffix = f"""
+    演讲中跳过的段落：{format_id_ranges(skipped_ids)}
+    
+    教授的问题：{question}
+    
+    请给出简洁、专业的回答建议。
+    """
+    if entry.mode == "provider":
+        prompt, cached_content = suffix, entry.cached_content
+    else:
+        prompt, cached_content = entry.prefix + suffix, None
+    context = {
+        "mode": entry.mode,
+        "prompt_tokens": estimate_tokens(prompt),
+        "prefix_tokens": entry.prefix_tokens
+    }
+    return prompt, len(skipped_ids) > 0, context, cached_content
 
 @app.post("/ask_qa")
-async def ask_qa(question: str):
+async def ask_qa(question: str, session_id: Optional[str] = None):
     """问答功能"""
     try:
-        script = presentation_data.get("script_content", "")
-        ppt_summary = presentation_data.get("ppt_analysis", {}).get("summary", "")
-        segments = presentation_data.get("segments", [])
-        
-        # 检查是否有跳过的段落
-        skipped = [s for s in segments if s.get("status") == "skipped"]
-        has_skipped = len(skipped) > 0
-        
-        prompt = f"""
-        你是一位演讲辅助专家。
-
-        演讲稿：{script[:1000]}
-        PPT摘要：{ppt_summary}
+        prompt, has_skipped, context, cached_content = _build_qa_prompt(session_id, question)
         
-        教授的问题：{question}
-        
-        请给出简洁、专业的回答建议。
-        """
-        
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        # 共享客户端：限流等待与重试退避不阻塞事件循环
+        response = await get_gemini_client().agenerate_content(prompt, cached_content=cached_content)
         
         answer = response.text
         if has_skipped:
-            answer = "⚠️ 提示：演讲中有部分内容被跳过，如果问题涉及这些内容，建议补充说明。\n\n" + answer
+            answer = SKIPPED_NOTICE + answer
         
         return {
             "success": True,
             "answer": answer,
-            "has_skipped_content": has_skipped
+            "has_skipped_content": has_skipped,
+            "context": context
         }
     
+    except GeminiUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI 回答失败: {str(e)}")
 
+@app.post("/ask_qa/stream")
+async def ask_qa_stream(question: str, session_id: Optional[str] = None):
+    """
+    流式问答（SSE）：先发送 meta（含 has_skipped_content），再逐段推送回答
+    结束事件 done 中分别给出首字延迟 ttft_ms 与总耗时 total_ms
+    """
+    try:
+        prompt, has_skipped, context, cached_content = _build_qa_prompt(session_id, question)
+        model = get_gemini_client()
+        if cached_content is not None:
+            model = model.bind(cached_content)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI 回答失败: {str(e)}")
+    
+    return StreamingResponse(
+        stream_answer(model, prompt, {"has_skipped_content": has_skipped, "context": context},
+                      prefix=SKIPPED_NOTICE if has_skipped else ""),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.websocket("/ws/speech")
-async def websocket_speech(websocket: WebSocket):
+async def websocket_speech(websocket: WebSocket, session_id: Optional[str] = None,
+                           encoding: str = "json"):
     """
     实时语音追踪 WebSocket
     轻量级版本：使用简单的文本匹配
@@ -212,109 +400,68 @@ async def websocket_speech(websocket: WebSocket):
     await websocket.accept()
     print("✅ WebSocket 连接已接受")
     
-    segments = presentation_data.get("segments", [])
+    session = sessions.resolve(session_id)
+    state = session.data if session else _new_session_data()
     
-    if len(segments) == 0:
+    segments = state.get("segments", [])
+    index = state.get("index")
+    journal = state["journal"]
+    
+    if len(segments) == 0 or index is None:
         await websocket.send_json({
             "error": "请先上传演讲稿"
         })
         await websocket.close()
         return
     
-    try:
-        while True:
-            # 接收前端发送的语音文字
-            data = await websocket.receive_json()
-            speech_text = data.get("text", "").strip()
-            
-            if not speech_text:
-                continue
-            
-            # 轻量级匹配逻辑：改进的相似度计算
-            matched_idx = -1
-            max_similarity = 0
-            
-            # 预处理语音文本：去除标点和空格
-            import re
-            speech_clean = re.sub(r'[，。！？；：、\s,\.!?;:\s]+', '', speech_text.lower())
+    # 增量推送：连接时发送一次完整演讲稿，之后只发送变化
+    stream = UpdateStream(journal, lambda: segments)
+    
+    async def match(text: str, is_final: bool):
+        sessions.touch(session)
+        
+        # 轻量级匹配逻辑：使用上传时构建的索引（三字组定位后求最长公共子串）
+        matched_idx, _ = index.match(text)
+        
+        # 临时转写（半句话）只推进到当前或下一段，不判定脱稿、不标记跳读
+        if not is_final and (matched_idx == -1 or state["current_idx"] == -1
+                             or not state["current_idx"] <= matched_idx <= state["current_idx"] + 1):
+            return {"matched": False}
+        
+        # 更新状态
+        if matched_idx != -1:
+            # 找到匹配
+            old_idx = state["current_idx"]
+            state["current_idx"] = matched_idx
+            state["is_free_style"] = False
             
-            # 设置匹配阈值（可调节）
-            MATCH_THRESHOLD = 0.5  # 50% 相似度即可匹配
-            MIN_MATCH_LENGTH = 3   # 至少匹配 3 个字符
+            # 标记已讲
+            if segments[matched_idx]["status"] != "covered":
+                segments[matched_idx]["status"] = "covered"
+                journal.record(matched_idx, "covered")
             
-            for idx, segment in enumerate(segments):
-                text = segment["text"]
-                text_clean = re.sub(r'[，。！？；：、\s,\.!?;:\s]+', '', text.lower())
-                
-                # 计算相似度
-                similarity = 0
-                
-                # 方法1: 简单包含关系
-                if speech_clean in text_clean or text_clean in speech_clean:
-                    similarity = 1.0
-                
-                # 方法2: 字符重叠比例
-                else:
-                    common_chars = set(speech_clean) & set(text_clean)
-                    if len(common_chars) > 0:
-                        # 计算重叠比例
-                        overlap_ratio = len(common_chars) / max(len(set(speech_clean)), len(set(text_clean)))
-                        
-                        # 检查连续子串
-                        max_substr = 0
-                        for i in range(len(speech_clean)):
-                            for j in range(i + MIN_MATCH_LENGTH, len(speech_clean) + 1):
-                                substr = speech_clean[i:j]
-                                if substr in text_clean:
-                                    max_substr = max(max_substr, len(substr))
-                        
-                        # 综合评分
-                        if max_substr >= MIN_MATCH_LENGTH:
-                            substr_ratio = max_substr / len(text_clean)
-                            similarity = (overlap_ratio * 0.3 + substr_ratio * 0.7)
-                
-                # 更新最佳匹配
-                if similarity > max_similarity and similarity >= MATCH_THRESHOLD:
-                    max_similarity = similarity
-                    matched_idx = idx
+            # 检测跳读
+            if old_idx != -1 and matched_idx > old_idx + 1:
+                # 中间被跳过的段落标记为 skipped
+                for i in range(old_idx + 1, matched_idx):
+                    if segments[i]["status"] == "pending":
+                        segments[i]["status"] = "skipped"
+                        journal.record(i, "skipped")
             
-            # 更新状态
-            if matched_idx != -1:
-                # 找到匹配
-                old_idx = presentation_data["current_idx"]
-                presentation_data["current_idx"] = matched_idx
-                presentation_data["is_free_style"] = False
-                
-                # 标记已讲
-                segments[matched_idx]["status"] = "covered"
-                
-                # 检测跳读
-                if old_idx != -1 and matched_idx > old_idx + 1:
-                    # 中间被跳过的段落标记为 skipped
-                    for i in range(old_idx + 1, matched_idx):
-                        if segments[i]["status"] == "pending":
-                            segments[i]["status"] = "skipped"
-                
-            else:
-                # 未找到匹配，可能是脱稿
-                presentation_data["is_free_style"] = True
+            journal.commit()
             
-            # 发送更新
-            await websocket.send_json({
-                "segments": segments,
-                "current_idx": presentation_data["current_idx"],
-                "is_free_style": presentation_data["is_free_style"],
-                "matched": matched_idx != -1
-            })
+        else:
+            # 未找到匹配，可能是脱稿
+            state["is_free_style"] = True
+        
+        return {"matched": matched_idx != -1}
     
-    except WebSocketDisconnect:
-        print("📴 WebSocket 客户端断开连接")
-    except Exception as e:
-        print(f"❌ WebSocket 错误: {e}")
-        try:
-            await websocket.send_json({"error": str(e)})
-        except:
-            pass
+    # 接收、匹配、发送并发执行（发送时才生成 delta，只发送位置和状态变化）
+    await SpeechPipeline(
+        websocket, stream,
+        lambda: (state["current_idx"], state["is_free_style"]),
+        match, session_id=session.session_id if session else None, encoding=encoding
+    ).run()
 
 if __name__ == "__main__":
     import uvicorn
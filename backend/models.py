@@ -1,6 +1,4 @@
 from enum import Enum
-from pydantic import BaseModel
-from typing import List, Optional
 
 class SegmentStatus(str, Enum):
     PENDING = "pending"
@@ -8,14 +6,5 @@ class SegmentStatus(str, Enum):
     SKIPPED = "skipped"
     CURRENT = "current"
 
-class ScriptSegment(BaseModel):
-    id: int
-    text: str
-    status: SegmentStatus = SegmentStatus.PENDING
-    embedding_idx: int
-
-class PresentationState(BaseModel):
-    segments: List[ScriptSegment]
-    current_idx: int = -1
-    is_free_style: bool = False
-
+# 状态的整数编码：段落存储的 int8 状态数组（segment_store.py）与二进制 delta（ws_codec.py）共用这一顺序
+STATUS_ORDER = (SegmentStatus.PENDING, SegmentStatus.COVERED, SegmentStatus.SKIPPED, SegmentStatus.CURRENT)
@@ -1,20 +1,148 @@
 import re
 import os
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
+import time
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Dict, Optional
 import numpy as np
-import google.generativeai as genai
-from pdf2image import convert_from_path
-from PIL import Image
+from embedding_backends import EMBEDDING_BACKEND, load_embedding_model
+from gemini_client import get_gemini_client
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# 注意：sentence_transformers / google.generativeai / pdf2image 体积较大，
+# 均在首次使用时才导入，保证 main.py 启动后能立即响应 /health
+
+# 推理并发数：同时执行 encode 的线程数（PyTorch 推理期间会释放 GIL）
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "1"))
+
+# PPT 逐页分析：同时进行的 Gemini 请求数 / 页面分析缓存条数
+PPT_ANALYSIS_CONCURRENCY = int(os.getenv("PPT_ANALYSIS_CONCURRENCY", "4"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+
+# PPT 页面图片：渲染 DPI / 最长边像素（0 表示不缩放）/ JPEG 重压缩质量（0 表示不压缩）
+PPT_RENDER_DPI = int(os.getenv("PPT_RENDER_DPI", "150"))
+PPT_PAGE_MAX_SIDE = int(os.getenv("PPT_PAGE_MAX_SIDE", "0"))
+PPT_PAGE_JPEG_QUALITY = int(os.getenv("PPT_PAGE_JPEG_QUALITY", "0"))
+
+class PageAnalysisCache:
+    """
+    页面分析结果缓存（LRU，线程安全）
+    以渲染后页面图片的哈希为键：重新上传略有修改的 PPT 时，只有改动过的页面需要重新分析
+    """
+
+    def __init__(self, max_entries: int = PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(img) -> str:
+        """页面图片指纹：尺寸 + 模式 + 像素数据的 SHA-256"""
+        digest = hashlib.sha256()
+        digest.update(f"{img.size}|{img.mode}".encode())
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: str, content: str):
+        with self._lock:
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# 进程内共享：不同会话上传同一份 PPT 也能命中
+_page_cache = PageAnalysisCache()
+
+def count_pdf_pages(file_path: str) -> int:
+    """读取 PDF 页数（不渲染）"""
+    from pdf2image import pdfinfo_from_path
+    return pdfinfo_from_path(file_path)["Pages"]
+
+def iter_pdf_pages(file_path: str, dpi: int = PPT_RENDER_DPI, total_pages: Optional[int] = None):
+    """
+    逐页渲染 PDF（生成器）：每次只把一页转换为图片
+    内存峰值与页数无关，不再一次性渲染整份 PPT
+    """
+    from pdf2image import convert_from_path
+    
+    if total_pages is None:
+        total_pages = count_pdf_pages(file_path)
+    for page_no in range(1, total_pages + 1):
+        images = convert_from_path(file_path, dpi=dpi, first_page=page_no, last_page=page_no)
+        if images:
+            yield page_no, images[0]
+
+def prepare_page_image(img, max_side: int = PPT_PAGE_MAX_SIDE,
+                       jpeg_quality: int = PPT_PAGE_JPEG_QUALITY):
+    """
+    分析前可选地缩小页面图片并重压缩为 JPEG，降低内存和上传到 Gemini 的数据量
+    """
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    
+    if jpeg_quality:
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format="JPEG", quality=jpeg_quality)
+        buffer.seek(0)
+        img = Image.open(buffer)
+        img.load()
+    
+    return img
 
 class ScriptProcessor:
-    def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2'):
-        # 使用多语言模型以支持中英文混合场景
-        self.model = SentenceTransformer(model_name)
-        # 使用最新的 Gemini 2.5 Flash 模型（2026年1月）
-        self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+    def __init__(self, model_name='paraphrase-multilingual-MiniLM-L12-v2',
+                 inference_workers: int = EMBED_CONCURRENCY,
+                 backend: str = EMBEDDING_BACKEND,
+                 gemini_model=None,
+                 page_cache: Optional[PageAnalysisCache] = None,
+                 ppt_concurrency: int = PPT_ANALYSIS_CONCURRENCY):
+        # 使用多语言模型以支持中英文混合场景（首次使用或预热时才加载）
+        self.model_name = model_name
+        self.backend = backend  # torch / int8 / onnx，见 embedding_backends.py
+        self._model = None
+        # 可注入任意提供 generate_content 的对象（例如测试用的本地假客户端）
+        self._gemini_model = gemini_model
+        
+        # PPT 逐页分析：有界并发 + 按页缓存
+        self.page_cache = page_cache if page_cache is not None else _page_cache
+        self.ppt_concurrency = max(1, ppt_concurrency)
+        self._load_lock = threading.Lock()
+        
+        # 预热进度（/ready 上报）
+        self.warmup_status = {
+            "stage": "pending",
+            "backend": backend,
+            "progress": 0.0,
+            "error": None,
+            "timings_ms": {}
+        }
+        self.first_inference_ms: Optional[float] = None
+        
+        # 专用推理线程池：encode 不再阻塞 uvicorn 事件循环
+        self.inference_workers = max(1, inference_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.inference_workers,
+            thread_name_prefix="inference"
+        )
+        self._stats_lock = threading.Lock()
+        self._submitted = 0  # 已提交未完成（排队 + 运行中）
+        self._running = 0
         
     def split_text(self, text: str) -> List[str]:
         """
@@ -40,13 +168,120 @@ class ScriptProcessor:
         
         return result
 
+    @property
+    def model(self):
+        """句向量模型（延迟加载，线程安全）"""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = load_embedding_model(self.model_name, self.backend)
+                    self.warmup_status["timings_ms"]["model_load"] = round(
+                        (time.perf_counter() - started) * 1000, 1
+                    )
+        return self._model
+
+    @property
+    def gemini_model(self):
+        # 共享客户端（限流 + 重试），默认使用 Gemini 2.5 Flash 模型
+        if self._gemini_model is None:
+            self._gemini_model = get_gemini_client()
+        return self._gemini_model
+
+    @property
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    def warmup(self):
+        """
+        预热：导入大型依赖、加载模型并执行一次推理
+        由 main.py 在启动后放到后台线程执行，进度写入 warmup_status
+        """
+        status = self.warmup_status
+        timings = status["timings_ms"]
+        try:
+            status["stage"] = "importing"
+            started = time.perf_counter()
+            get_gemini_client().model()
+            timings["import_genai"] = round((time.perf_counter() - started) * 1000, 1)
+            status["progress"] = 0.2
+
+            status["stage"] = "loading_model"
+            self.model
+            status["progress"] = 0.8
+
+            status["stage"] = "warming_up"
+            started = time.perf_counter()
+            # 直接调用模型，避免计入首次请求延迟统计
+            self.model.encode(["预热 warmup"], show_progress_bar=False)
+            timings["first_encode"] = round((time.perf_counter() - started) * 1000, 1)
+
+            status["stage"] = "ready"
+            status["progress"] = 1.0
+        except Exception as e:
+            status["stage"] = "failed"
+            status["error"] = str(e)
+
     def get_embeddings(self, texts: List[str]):
         """生成多语言向量"""
+        if self.first_inference_ms is None:
+            # 首次请求延迟（未预热时包含模型加载时间）
+            started = time.perf_counter()
+            result = self.model.encode(texts, show_progress_bar=False)
+            self.first_inference_ms = round((time.perf_counter() - started) * 1000, 1)
+            return result
         return self.model.encode(texts, show_progress_bar=False)
 
-    def extract_pdf_with_gemini(self, file_path: str) -> Dict[str, any]:
+    async def aget_embeddings(self, texts: List[str]):
+        """
+        异步生成向量：在推理线程池中执行，事件循环可以继续处理其他连接
+        """
+        return await asyncio.wrap_future(self.submit_embeddings(texts))
+
+    def submit_embeddings(self, texts: List[str]) -> Future:
+        """
+        提交到推理线程池（后台任务线程使用：与实时语音共享 EMBED_CONCURRENCY 并发上限）
+        """
+        with self._stats_lock:
+            self._submitted += 1
+        future = self._executor.submit(self._run_inference, texts)
+        future.add_done_callback(self._on_inference_done)
+        return future
+
+    def _on_inference_done(self, _future: Future):
+        with self._stats_lock:
+            self._submitted -= 1
+
+    def _run_inference(self, texts: List[str]):
+        with self._stats_lock:
+            self._running += 1
+        try:
+            return self.get_embeddings(texts)
+        finally:
+            with self._stats_lock:
+                self._running -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """等待推理线程的请求数（不含正在运行的）"""
+        with self._stats_lock:
+            return self._submitted - self._running
+
+    def inference_stats(self) -> Dict[str, int]:
+        """推理队列状态（用于 /health 上报）"""
+        with self._stats_lock:
+            return {
+                "workers": self.inference_workers,
+                "running": self._running,
+                "queued": self._submitted - self._running
+            }
+
+    def extract_pdf_with_gemini(self, file_path: str,
+                                on_total: Optional[Callable[[int], None]] = None,
+                                on_page: Optional[Callable[[Dict[str, any]], None]] = None) -> Dict[str, any]:
         """
         使用 Gemini 多模态能力深度理解 PDF/PPT
+        on_total(页数) / on_page(单页分析结果) 用于向后台任务汇报进度（页面完成顺序不保证）
         返回：{
             'summary': 整体内容摘要,
             'pages': [每页的详细分析],
@@ -54,28 +289,34 @@ class ScriptProcessor:
         }
         """
         try:
-            # 将 PDF 转换为图片（每页一张）
-            images = convert_from_path(file_path, dpi=150)
+            total_pages = count_pdf_pages(file_path)
+            if on_total:
+                on_total(total_pages)
+            
+            def collect(futures):
+                for future in futures:
+                    page = future.result()
+                    pages_analysis.append(page)
+                    if on_page:
+                        on_page(page)
             
+            # 逐页渲染 + 逐页分析：最多 ppt_concurrency 页同时请求 Gemini，
+            # 渲染好的图片不超过 ppt_concurrency + 1 张，内存峰值与页数无关
             pages_analysis = []
-            for i, img in enumerate(images):
-                # 用 Gemini 分析每一页（包含文字+图表+布局理解）
-                prompt = f"""
-                这是演讲 PPT 的第 {i+1} 页。请详细分析：
-                1. 页面上的所有文字内容（中英文均需提取）
-                2. 图表、图片的含义和传达的信息
-                3. 该页的核心论点是什么
-                
-                请用简洁的语言总结，方便后续问答使用。
-                """
-                
-                response = self.gemini_model.generate_content([prompt, img])
-                pages_analysis.append({
-                    'page': i + 1,
-                    'content': response.text
-                })
+            with ThreadPoolExecutor(max_workers=self.ppt_concurrency,
+                                    thread_name_prefix="ppt-page") as pool:
+                in_flight = set()
+                for page_no, img in iter_pdf_pages(file_path, total_pages=total_pages):
+                    if len(in_flight) >= self.ppt_concurrency:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    in_flight.add(pool.submit(self._analyze_page, page_no, prepare_page_image(img)))
+                    del img
+                collect(in_flight)
+            
+            pages_analysis.sort(key=lambda p: p['page'])
             
-            # 生成整体摘要
+            # 所有页面完成后立即生成整体摘要
             all_content = "\n\n".join([p['content'] for p in pages_analysis])
             summary_prompt = f"""
             以下是一份演讲 PPT 的逐页分析：
@@ -93,7 +334,8 @@ class ScriptProcessor:
             return {
                 'summary': summary_response.text,
                 'pages': pages_analysis,
-                'key_points': self._extract_key_points(summary_response.text)
+                'key_points': self._extract_key_points(summary_response.text),
+                'cached_pages': sum(1 for p in pages_analysis if p.get('cached'))
             }
         
         except Exception as e:
@@ -104,6 +346,27 @@ class ScriptProcessor:
                 'key_points': []
             }
     
+    def _analyze_page(self, page_no: int, img) -> Dict[str, any]:
+        """分析单页（在线程池中执行），命中缓存时不调用 Gemini"""
+        key = self.page_cache.fingerprint(img)
+        content = self.page_cache.get(key)
+        if content is not None:
+            return {'page': page_no, 'content': content, 'cached': True}
+        
+        # 用 Gemini 分析每一页（包含文字+图表+布局理解）
+        prompt = f"""
+        这是演讲 PPT 的第 {page_no} 页。请详细分析：
+        1. 页面上的所有文字内容（中英文均需提取）
+        2. 图表、图片的含义和传达的信息
+        3. 该页的核心论点是什么
+        
+        请用简洁的语言总结，方便后续问答使用。
+        """
+        
+        response = self.gemini_model.generate_content([prompt, img])
+        self.page_cache.put(key, response.text)
+        return {'page': page_no, 'content': response.text, 'cached': False}
+    
     def _extract_key_points(self, text: str) -> List[str]:
         """从摘要中提取关键点"""
         lines = text.split('\n')
@@ -126,3 +389,17 @@ def calculate_similarity(vec1, vec2):
     
     return float(dot_product / (norm_a * norm_b))
 
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """
+    按行 L2 归一化向量矩阵（一次性预处理）
+    归一化后余弦相似度 = 点积，零向量行保持为 0（与 calculate_similarity 的除零保护一致）
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    safe_norms = np.where(norms < 1e-10, 1.0, norms)
+    normed = matrix / safe_norms
+    normed[norms[:, 0] < 1e-10] = 0.0
+    return normed
+
@@ -4,17 +4,61 @@ Lightweight Processor for fast deployment
 """
 
 import re
-import os
-from typing import List, Dict
-import google.generativeai as genai
+import time
+from typing import List, Dict, Optional
 import fitz  # PyMuPDF
+from text_index import normalize_text, char_ngrams
+from gemini_client import get_gemini_client
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# PDF 文本提取参数
+PROMPT_TEXT_BUDGET = 3000      # 送入 Gemini 摘要的文本上限（字符）
+
+def extract_pdf_text(file_path: str, max_chars: Optional[int] = None) -> Dict[str, any]:
+    """
+    按页顺序提取 PDF 文本
+    指定 max_chars（提示词预算）时预算用完立即停止，后续页不再解析：
+    大文档的摘要通常只需要前几页，提取耗时与预算成正比而不是与总页数成正比
+    返回：{'text': 拼接文本（不超过 max_chars）, 'pages': 逐页文本, 'stats': 页级耗时统计}
+    """
+    started = time.perf_counter()
+    parts: List[str] = []
+    pages: List[Dict[str, any]] = []
+    page_ms: List[float] = []
+    remaining = max_chars
+    
+    with fitz.open(file_path) as doc:
+        total_pages = len(doc)
+        for page_num in range(total_pages):
+            page_started = time.perf_counter()
+            text = doc[page_num].get_text()
+            page_ms.append((time.perf_counter() - page_started) * 1000)
+            pages.append({'page': page_num + 1, 'content': text})
+            if remaining is None:
+                parts.append(text)
+                continue
+            parts.append(text[:remaining])
+            remaining -= min(len(text), remaining)
+            if remaining <= 0:
+                break
+    
+    total_ms = (time.perf_counter() - started) * 1000
+    return {
+        'text': "".join(parts),
+        'pages': pages,
+        'stats': {
+            'total_pages': total_pages,
+            'extracted_pages': len(pages),
+            'truncated': len(pages) < total_pages,
+            'total_ms': round(total_ms, 1),
+            'avg_page_ms': round(sum(page_ms) / len(page_ms), 2) if page_ms else 0.0,
+            'max_page_ms': round(max(page_ms), 2) if page_ms else 0.0
+        }
+    }
 
 class ScriptProcessor:
     def __init__(self):
         # 轻量级版本：不使用大型 ML 模型
-        self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        self.gemini_model = get_gemini_client()
         
     def split_text(self, text: str) -> List[str]:
         """
@@ -45,27 +89,15 @@ class ScriptProcessor:
         使用 Gemini 多模态能力深度理解 PDF/PPT
         """
         try:
-            # 使用 PyMuPDF 提取文本
-            doc = fitz.open(file_path)
-            pages_analysis = []
-            
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                text = page.get_text()
-                
-                pages_analysis.append({
-                    'page': page_num + 1,
-                    'content': text
-                })
-            
-            doc.close()
+            # 使用 PyMuPDF 按页提取文本（提示词预算用完即停止）
+            extracted = extract_pdf_text(file_path, max_chars=PROMPT_TEXT_BUDGET)
+            pages_analysis = extracted['pages']
             
             # 生成整体摘要
-            all_content = "\n\n".join([p['content'] for p in pages_analysis])
             summary_prompt = f"""
             以下是一份演讲 PPT 的文本内容：
             
-            {all_content[:3000]}  # 限制长度
+            {extracted['text']}
             
             请提取：
             1. 整体主题
@@ -78,7 +110,8 @@ class ScriptProcessor:
             return {
                 'summary': summary_response.text,
                 'pages': pages_analysis,
-                'key_points': self._extract_key_points(summary_response.text)
+                'key_points': self._extract_key_points(summary_response.text),
+                'extract_stats': extracted['stats']
             }
         
         except Exception as e:
@@ -100,21 +133,18 @@ class ScriptProcessor:
 
 def calculate_similarity(vec1, vec2):
     """
-    简化版相似度计算：基于文本重叠
+    简化版相似度计算：基于字符 n-gram 重叠
+    （中文没有空格，按词切分对中文无效）
     """
     if isinstance(vec1, dict) and isinstance(vec2, dict):
-        text1 = vec1.get('text', '').lower()
-        text2 = vec2.get('text', '').lower()
-        
-        # 简单的文本相似度：计算共同词数
-        words1 = set(text1.split())
-        words2 = set(text2.split())
+        grams1 = set(char_ngrams(normalize_text(vec1.get('text', ''))))
+        grams2 = set(char_ngrams(normalize_text(vec2.get('text', ''))))
         
-        if not words1 or not words2:
+        if not grams1 or not grams2:
             return 0.0
         
-        common = words1.intersection(words2)
-        return len(common) / max(len(words1), len(words2))
+        common = grams1.intersection(grams2)
+        return len(common) / max(len(grams1), len(grams2))
     
     return 0.0
 
@@ -0,0 +1,164 @@
+"""
+问答提示词静态前缀缓存（main.py 与 main_lite.py 共用）
+Cache the static part of the Q&A prompt per session
+
+问答提示词拆成两部分：
+- 静态前缀：角色与约束、带段落编号的演讲稿全文、PPT 分析，只在上传演讲稿 / PPT 时变化
+- 动态后缀：演讲进度（已讲 / 跳过的段落编号）与问题，每次提问都不同
+
+上传时登记前缀（后台线程执行，不阻塞上传接口），按前缀长度选择模式：
+- inline：前缀不超过检索模式的上下文预算（QA_TOKEN_BUDGET），每次发送“相同前缀 + 后缀”，
+          前缀字节完全一致，可命中模型的隐式前缀缓存，且不比检索模式多用 token
+- provider：前缀较长且显式开启了 QA_CONTEXT_CACHE=1，创建 Gemini 服务端上下文缓存
+            （按存储时长计费），提问时只发送动态后缀
+- retrieval：其余情况，提问时退回按相关度检索上下文（受 QA_TOKEN_BUDGET 约束）
+本地登记表以前缀哈希校验：演讲稿或 PPT 变化后旧缓存立即失效，服务端缓存过期后自动重建。
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from gemini_client import get_gemini_client
+from qa_context import QA_TOKEN_BUDGET, estimate_tokens
+
+QA_CONTEXT_CACHE = os.getenv("QA_CONTEXT_CACHE", "0") == "1"  # 设为 1 才创建服务端缓存
+QA_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("QA_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+QA_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("QA_CONTEXT_CACHE_MIN_TOKENS", "1024"))  # 服务端缓存的最小长度
+QA_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("QA_CONTEXT_CACHE_MAX_ENTRIES", "64"))
+
+
+def prefix_hash(prefix: str) -> str:
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+
+class PrefixEntry:
+    """单个会话登记的静态前缀"""
+
+    def __init__(self, scope: str, prefix: str, mode: str):
+        self.scope = scope
+        self.prefix = prefix
+        self.prefix_hash = prefix_hash(prefix)
+        self.prefix_tokens = estimate_tokens(prefix)
+        self.mode = mode  # provider / inline / retrieval
+        self.cached_content = None
+        self.expires_at: Optional[float] = None
+        self.created_at = time.time()
+        self.uses = 0
+        self.error: Optional[str] = None
+
+    @property
+    def expired(self) -> bool:
+        # 提前一分钟视为过期，避免请求途中缓存失效
+        return self.expires_at is not None and time.time() > self.expires_at - 60
+
+
+class PromptPrefixCache:
+    """
+    静态前缀登记表：按会话保存前缀及其服务端缓存（LRU，线程安全）
+    """
+
+    def __init__(self, enabled: bool = QA_CONTEXT_CACHE,
+                 ttl_seconds: int = QA_CONTEXT_CACHE_TTL_SECONDS,
+                 min_tokens: int = QA_CONTEXT_CACHE_MIN_TOKENS,
+                 max_entries: int = QA_CONTEXT_CACHE_MAX_ENTRIES,
+                 inline_max_tokens: int = QA_TOKEN_BUDGET):
+        self.enabled = enabled
+        self.inline_max_tokens = inline_max_tokens
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, PrefixEntry]" = OrderedDict()
+        self._pending: Dict[str, str] = {}  # scope -> 正在创建的前缀哈希
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-cache")
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def refresh_async(self, scope: str, prefix: str) -> str:
+        """
+        上传演讲稿 / PPT 后调用：后台登记新前缀，立即返回前缀哈希（存入会话用于校验）
+        """
+        digest = prefix_hash(prefix)
+        with self._lock:
+            entry = self._entries.get(scope)
+            if (entry and entry.prefix_hash == digest and not entry.expired) \
+                    or self._pending.get(scope) == digest:
+                return digest
+            self._pending[scope] = digest
+        self._executor.submit(self._refresh, scope, prefix, digest)
+        return digest
+
+    def lookup(self, scope: str, digest: Optional[str]) -> Optional[PrefixEntry]:
+        """
+        提问时查找与会话当前前缀一致的登记项；尚未就绪或已失效时返回 None（调用方退回检索模式）
+        """
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None or digest is None or entry.prefix_hash != digest:
+                self.misses += 1
+                return None
+            if entry.mode == "provider" and entry.expired:
+                self.misses += 1
+                expired_prefix = entry.prefix
+            else:
+                entry.uses += 1
+                self.hits += 1
+                self._entries.move_to_end(scope)
+                return entry
+        # 服务端缓存已过期：后台重建，本次先退回检索模式
+        self.refresh_async(scope, expired_prefix)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            modes = [e.mode for e in self._entries.values()]
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "provider": modes.count("provider"),
+                "inline": modes.count("inline"),
+                "retrieval": modes.count("retrieval"),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "refreshes": self.refreshes
+            }
+
+    def _refresh(self, scope: str, prefix: str, digest: str):
+        entry = PrefixEntry(scope, prefix, "inline")
+        if entry.prefix_tokens > self.inline_max_tokens:
+            entry.mode = "retrieval"
+            if self.enabled and entry.prefix_tokens >= self.min_tokens:
+                try:
+                    entry.cached_content = get_gemini_client().create_cached_content(prefix, self.ttl_seconds)
+                    entry.expires_at = time.time() + self.ttl_seconds
+                    entry.mode = "provider"
+                except Exception as e:
+                    # 模型或 SDK 不支持上下文缓存、配额不足等：退回检索模式
+                    entry.error = str(e)
+
+        stale = []
+        with self._lock:
+            if self._pending.get(scope) != digest:
+                # 创建期间又有新的上传，本次结果作废
+                stale.append(entry)
+            else:
+                self._pending.pop(scope, None)
+                old = self._entries.pop(scope, None)
+                if old is not None:
+                    stale.append(old)
+                self._entries[scope] = entry
+                self.refreshes += 1
+                while len(self._entries) > self.max_entries:
+                    stale.append(self._entries.popitem(last=False)[1])
+
+        for old in stale:
+            if old.cached_content is not None:
+                get_gemini_client().delete_cached_content(old.cached_content)
@@ -0,0 +1,140 @@
+"""
+WebSocket 增量推送协议（main.py 与 main_lite.py 共用）
+Versioned delta protocol for /ws/speech
+
+服务端 -> 客户端：
+- snapshot：连接时发送一次完整演讲稿
+  {"type": "snapshot", "version", "current_idx", "is_free_style", "segments": [{id, status, text}]}
+- delta：每次识别后只发送自上个版本以来的状态变化
+  {"type": "delta", "base_version", "version", "current_idx", "is_free_style", "changes": [{id, status}]}
+- ping / pong：心跳（见 speech_stream.py）
+
+客户端 -> 服务端：
+- {"text": "...", "utterance_id", "is_final"}：语音识别结果（中间结果合并规则见 transcripts.py）
+- {"type": "resync"}：客户端版本与 base_version 不一致时请求重新下发 snapshot
+- {"type": "ping", "t"} / {"type": "pong", "t"}：心跳
+
+"""
+
+import sys
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+_LOG_ENTRY_BYTES = 100  # 每条变更 (version, segment_id, status) 元组的粗略大小
+
+
+class StatusJournal:
+    """
+    段落状态变更日志：每次提交生成一个新版本
+    只保留最近 max_entries 条变更，过旧的客户端版本需要重新同步
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.version = 0
+        self.max_entries = max_entries
+        self._log = deque()   # (version, segment_id, status)
+        self._pending: Dict[int, str] = {}
+        self._floor = 0       # 已被裁剪的最高版本号
+
+    @property
+    def nbytes(self) -> int:
+        """粗略内存占用（按条数估算，不逐条遍历）"""
+        return sys.getsizeof(self._log) + sys.getsizeof(self._pending) + len(self._log) * _LOG_ENTRY_BYTES
+
+    def record(self, segment_id: int, status: str):
+        """记录一次状态变化（提交前可多次覆盖）"""
+        self._pending[segment_id] = status
+
+    def commit(self) -> int:
+        """提交待定变化，有变化时版本号 +1"""
+        if self._pending:
+            self.version += 1
+            for segment_id, status in self._pending.items():
+                self._log.append((self.version, segment_id, status))
+            self._pending.clear()
+
+            while len(self._log) > self.max_entries:
+                version, _, _ = self._log.popleft()
+                self._floor = max(self._floor, version)
+
+        return self.version
+
+    def changes_since(self, version: int) -> Optional[Dict[int, str]]:
+        """
+        返回 version 之后的状态变化 {segment_id: status}
+        版本过旧（日志已裁剪）或版本号无效时返回 None，调用方应改发 snapshot
+        """
+        if version is None or version > self.version or version < self._floor:
+            return None
+
+        changes: Dict[int, str] = {}
+        for entry_version, segment_id, status in reversed(self._log):
+            if entry_version <= version:
+                break
+            # 倒序遍历：同一段落只保留最新状态
+            changes.setdefault(segment_id, status)
+        return changes
+
+
+def build_snapshot(segments: List[dict], current_idx: int, is_free_style: bool,
+                   version: int, **extra) -> dict:
+    """完整状态消息（连接时或重新同步时发送）"""
+    message = {
+        "type": "snapshot",
+        "version": version,
+        "current_idx": current_idx,
+        "is_free_style": is_free_style,
+        "segments": segments
+    }
+    message.update(extra)
+    return message
+
+
+def build_delta(changes: Dict[int, str], current_idx: int, is_free_style: bool,
+                base_version: int, version: int, **extra) -> dict:
+    """增量消息：只包含位置、脱稿标记和状态变化"""
+    message = {
+        "type": "delta",
+        "base_version": base_version,
+        "version": version,
+        "current_idx": current_idx,
+        "is_free_style": is_free_style,
+        "changes": [
+            {"id": segment_id, "status": status}
+            for segment_id, status in sorted(changes.items())
+        ]
+    }
+    message.update(extra)
+    return message
+
+
+class UpdateStream:
+    """
+    单个 WebSocket 连接的推送状态：记录该客户端已确认的版本，
+    自动在 delta 与 snapshot 之间选择
+    """
+
+    def __init__(self, journal: StatusJournal, segments_provider: Callable[[], List[dict]]):
+        self.journal = journal
+        self.segments_provider = segments_provider
+        self.client_version: Optional[int] = None
+
+    def snapshot(self, current_idx: int, is_free_style: bool, **extra) -> dict:
+        self.client_version = self.journal.version
+        return build_snapshot(self.segments_provider(), current_idx, is_free_style,
+                              self.client_version, **extra)
+
+    def update(self, current_idx: int, is_free_style: bool, **extra) -> dict:
+        changes = self.journal.changes_since(self.client_version)
+        if changes is None:
+            return self.snapshot(current_idx, is_free_style, **extra)
+
+        base_version = self.client_version
+        self.client_version = self.journal.version
+        return build_delta(changes, current_idx, is_free_style,
+                           base_version, self.client_version, **extra)
+
+
+def is_resync_request(data: dict) -> bool:
+    """客户端是否请求重新同步"""
+    return isinstance(data, dict) and data.get("type") == "resync"
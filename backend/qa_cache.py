@@ -0,0 +1,143 @@
+"""
+问答语义缓存（完整版 main.py 使用）
+Semantic answer cache for repeated and paraphrased Q&A questions
+
+排练时同一个问题（或换个说法）会被反复提问。缓存按问题向量做近似匹配：
+与已回答问题的余弦相似度达到阈值即直接返回缓存的回答，不再调用 Gemini。
+- 每个会话一个作用域，记录演讲状态指纹（演讲稿哈希 + 跳过段落 ID + PPT 摘要哈希）；
+  指纹变化说明回答依据的状态已变（如新增跳过段落），该会话的缓存整体失效
+- 全局 LRU，条目数有上限；统计命中率、失效与淘汰次数
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+QA_CACHE_SIZE = int(os.getenv("QA_CACHE_SIZE", "256"))
+QA_CACHE_THRESHOLD = float(os.getenv("QA_CACHE_THRESHOLD", "0.92"))
+
+
+@lru_cache(maxsize=64)
+def _text_digest(text: str) -> bytes:
+    """演讲稿 / PPT 摘要的哈希：指纹在每次位置更新时都会计算，同一文本只哈希一次"""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def state_fingerprint(script_text: str, skipped_ids: Iterable[int], ppt_summary: str = "") -> str:
+    """
+    演讲状态指纹：只包含会影响回答的部分
+    已讲进度推进不会使缓存失效，跳过段落集合变化才会
+    """
+    digest = hashlib.sha1()
+    digest.update(_text_digest(script_text))
+    digest.update(",".join(str(i) for i in sorted(skipped_ids)).encode("ascii"))
+    digest.update(_text_digest(ppt_summary))
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    按问题向量近似匹配的回答缓存（线程安全）
+    向量需预先 L2 归一化，点积即余弦相似度
+    """
+
+    def __init__(self, max_entries: int = QA_CACHE_SIZE, threshold: float = QA_CACHE_THRESHOLD):
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._fingerprints: Dict[str, str] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def lookup(self, scope: str, fingerprint: str, vec: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        查找相似问题的缓存回答：命中返回 {'answer', 'meta', 'similarity'}，否则返回 None
+        """
+        with self._lock:
+            self._check_fingerprint(scope, fingerprint)
+
+            best_id, best_sim = None, self.threshold
+            for entry_id, entry in self._entries.items():
+                if entry["scope"] != scope:
+                    continue
+                sim = float(entry["vec"] @ vec)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            return {"answer": entry["answer"], "meta": entry["meta"], "similarity": round(best_sim, 4)}
+
+    def store(self, scope: str, fingerprint: str, vec: np.ndarray, answer: str,
+              meta: Dict[str, Any], adopt: bool = False):
+        """
+        写入回答；生成期间演讲状态已变化（指纹不一致）的回答直接丢弃
+        adopt=True 表示调用方已确认 fingerprint 是当前状态（如预生成），以它为准更新作用域指纹
+        """
+        with self._lock:
+            if adopt:
+                self._check_fingerprint(scope, fingerprint)
+            elif self._fingerprints.get(scope) != fingerprint:
+                return
+            self._entries[self._next_id] = {
+                "scope": scope,
+                "vec": np.asarray(vec, dtype=np.float32),
+                "answer": answer,
+                "meta": meta
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.evictions += 1
+                # 作用域已无条目时不再保留其指纹（会话结束后不会无限增长）
+                if not any(e["scope"] == evicted["scope"] for e in self._entries.values()):
+                    self._fingerprints.pop(evicted["scope"], None)
+
+    def drop_scope(self, scope: str):
+        """删除某个会话的全部缓存与指纹（会话被淘汰或替换演讲稿时调用）"""
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry["scope"] == scope]
+            for entry_id in stale:
+                del self._entries[entry_id]
+            self._fingerprints.pop(scope, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions
+            }
+
+    def _check_fingerprint(self, scope: str, fingerprint: str):
+        previous = self._fingerprints.get(scope)
+        if previous == fingerprint:
+            return
+        self._fingerprints[scope] = fingerprint
+        if previous is None:
+            return
+        # 演讲状态变化：该作用域下的缓存全部失效
+        stale = [entry_id for entry_id, entry in self._entries.items() if entry["scope"] == scope]
+        for entry_id in stale:
+            del self._entries[entry_id]
+        self.invalidations += 1
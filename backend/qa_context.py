@@ -0,0 +1,96 @@
+"""
+问答上下文检索（main.py 与 main_lite.py 共用）
+Select the most relevant script segments and PPT pages for a Q&A prompt
+
+不再把整份演讲稿和 PPT 塞进提示词：各版本先按与问题的相关度给段落/页面打分
+（完整版用句向量余弦，轻量版用 BM25），这里按分数挑选并控制在 token 预算内，
+再按原文顺序输出，每段带上 COVERED / SKIPPED / PENDING 状态标签。
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+QA_TOP_K = int(os.getenv("QA_TOP_K", "8"))                  # 按相关度选取的段落数
+QA_SKIPPED_TOP_K = int(os.getenv("QA_SKIPPED_TOP_K", "2"))  # 额外保证入选的最相关跳过段落数
+QA_PPT_TOP_K = int(os.getenv("QA_PPT_TOP_K", "3"))          # 选取的 PPT 页数
+QA_TOKEN_BUDGET = int(os.getenv("QA_TOKEN_BUDGET", "1500")) # 检索上下文的 token 上限
+QA_ITEM_MAX_CHARS = 600                                     # 单条上下文（如 PPT 页面分析）截断长度
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def top_indices(scores: List[float], k: int, allowed: Optional[List[int]] = None) -> List[int]:
+    """分数最高的 k 个下标（可限定候选下标），分数相同时保持原文顺序"""
+    candidates = range(len(scores)) if allowed is None else allowed
+    return sorted(candidates, key=lambda i: (-scores[i], i))[:max(0, k)]
+
+
+def context_item(kind: str, key: int, label: str, text: str, score: float,
+                 pinned: bool = False) -> Dict:
+    """
+    一条候选上下文：kind 为 segment / page，key 为段落下标或页码
+    pinned 的条目优先占用预算（如与问题最相关的跳过段落，保证 ⚠️ 提醒不丢失）
+    """
+    text = text.strip()
+    if len(text) > QA_ITEM_MAX_CHARS:
+        text = text[:QA_ITEM_MAX_CHARS] + "…"
+    return {"kind": kind, "key": key, "label": label, "text": text,
+            "score": float(score), "pinned": pinned}
+
+
+def select_context(items: List[Dict], token_budget: int = QA_TOKEN_BUDGET) -> List[Dict]:
+    """
+    pinned 条目优先，其余按分数从高到低放入上下文，超出预算的条目跳过；
+    返回结果按段落在前、页面在后，各自按原文顺序排列
+    """
+    selected = []
+    seen = set()
+    used = 0
+    for item in sorted(items, key=lambda it: (not it["pinned"], -it["score"])):
+        ident = (item["kind"], item["key"])
+        if ident in seen:
+            continue
+        cost = estimate_tokens(item["text"]) + 4
+        if used + cost > token_budget:
+            continue
+        seen.add(ident)
+        selected.append(item)
+        used += cost
+    return sorted(selected, key=lambda it: (it["kind"] != "segment", it["key"]))
+
+
+def format_context(selected: List[Dict]) -> Dict[str, str]:
+    """把选中的条目格式化为提示词片段：{'segments': ..., 'pages': ...}"""
+    segments = [f"[{it['label']}] {it['text']}" for it in selected if it["kind"] == "segment"]
+    pages = [f"[PPT 第{it['key']}页] {it['text']}" for it in selected if it["kind"] == "page"]
+    return {
+        "segments": "\n".join(segments) if segments else "（无相关段落）",
+        "pages": "\n".join(pages) if pages else "（无相关页面）"
+    }
+
+
+def format_id_ranges(ids: List[int]) -> str:
+    """把段落编号压缩为区间文本：[0,1,2,5,7,8] -> '#0-2, #5, #7-8'"""
+    ranges = []
+    for i in sorted(ids):
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ", ".join(f"#{a}" if a == b else f"#{a}-{b}" for a, b in ranges) or "无"
+
+
+def context_stats(selected: List[Dict], prompt: str) -> Dict[str, int]:
+    """上下文规模统计（随回答一同返回，便于观察提示词大小）"""
+    return {
+        "segments": sum(1 for it in selected if it["kind"] == "segment"),
+        "pages": sum(1 for it in selected if it["kind"] == "page"),
+        "prompt_tokens": estimate_tokens(prompt)
+    }
@@ -0,0 +1,101 @@
+"""
+问答流式输出（main.py 与 main_lite.py 共用）
+Stream Gemini answers to the client as Server-Sent Events
+
+事件顺序：
+- meta：生成开始前立即发送（含 has_skipped_content），前端可马上显示 ⚠️ 提示
+- token：模型每产生一段文本推送一次
+- error：生成失败
+- done：结束，附带首字延迟 ttft_ms 与总耗时 total_ms
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # 关闭反向代理缓冲，保证逐段送达
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """编码一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chunk_text(chunk) -> str:
+    # 被安全策略拦截等情况下分片没有文本，访问 .text 会抛异常
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+async def stream_answer(model, prompt: str, meta: Dict[str, Any], prefix: str = "",
+                        on_complete: Optional[Callable[[str], None]] = None) -> AsyncIterator[str]:
+    """
+    以 SSE 形式流式转发 generate_content(stream=True) 的输出
+    Gemini SDK 的流式接口是同步迭代器，放到线程中执行，经队列送回事件循环
+    prefix：服务端固定提示文本，紧跟 meta 发送（不计入首字延迟）
+    on_complete：生成成功结束后以完整回答调用（如写入缓存）
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    started = time.perf_counter()
+
+    def produce():
+        try:
+            for chunk in model.generate_content(prompt, stream=True):
+                if cancelled.is_set():
+                    return
+                text = _chunk_text(chunk)
+                if text:
+                    loop.call_soon_threadsafe(queue.put_nowait, ("token", text))
+            loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", str(e)))
+
+    yield sse_event("meta", meta)
+    if prefix:
+        yield sse_event("token", {"text": prefix})
+
+    loop.run_in_executor(None, produce)
+    ttft_ms = None
+    parts = []
+    try:
+        while True:
+            kind, payload = await queue.get()
+            if kind == "token":
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(payload)
+                yield sse_event("token", {"text": payload})
+            elif kind == "error":
+                yield sse_event("error", {"detail": f"AI 回答失败: {payload}"})
+                break
+            else:
+                if on_complete:
+                    on_complete("".join(parts))
+                break
+
+        yield sse_event("done", {
+            "ttft_ms": ttft_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "chars": sum(len(p) for p in parts)
+        })
+    finally:
+        # 客户端断开时通知生成线程停止读取剩余分片
+        cancelled.set()
+
+
+async def stream_cached(answer: str, meta: Dict[str, Any]) -> AsyncIterator[str]:
+    """缓存命中时以同样的事件格式一次性返回完整回答"""
+    started = time.perf_counter()
+    yield sse_event("meta", meta)
+    yield sse_event("token", {"text": answer})
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    yield sse_event("done", {"ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "chars": len(answer)})
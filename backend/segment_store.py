@@ -0,0 +1,98 @@
+"""
+演讲稿段落的列式存储（完整版 main.py 使用）
+Columnar, array-backed segment store
+
+万段级演讲稿下，每段一个 Pydantic 对象的内存与遍历开销都很可观。这里按列存放：
+- status：int8 状态数组（编码见 STATUS_CODES），跳读标记、状态统计均为向量化切片操作
+- 文本：所有段落 UTF-8 拼接成一个 bytes 缓冲区 + int64 偏移数组，按需解码单段
+- normed_embeddings：L2 归一化后的 float32 向量矩阵（匹配与问答检索共用，不再保留未归一化副本）
+上传响应与 WebSocket snapshot 直接由数组生成段落字典（to_dicts），不再逐段构建 Pydantic 对象。
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from models import STATUS_ORDER, SegmentStatus
+from processor import normalize_embeddings
+
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_ORDER)}
+_STATUS_VALUES = [status.value for status in STATUS_ORDER]
+
+
+class SegmentStore:
+    """段落列式存储：段落编号即数组下标"""
+
+    def __init__(self, texts: List[str], embeddings: np.ndarray):
+        encoded = [text.encode("utf-8") for text in texts]
+        self._buffer = b"".join(encoded)
+        self._offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=self._offsets[1:])
+        self.status = np.zeros(len(encoded), dtype=np.int8)
+        self.normed_embeddings = normalize_embeddings(np.asarray(embeddings, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.status)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes + self.status.nbytes + self.normed_embeddings.nbytes
+
+    # ---- 文本 ----
+
+    def text(self, idx: int) -> str:
+        return self._buffer[self._offsets[idx]:self._offsets[idx + 1]].decode("utf-8")
+
+    def texts(self, indices: Optional[Iterable[int]] = None) -> List[str]:
+        if indices is None:
+            indices = range(len(self))
+        return [self.text(i) for i in indices]
+
+    # ---- 状态 ----
+
+    def status_of(self, idx: int) -> SegmentStatus:
+        return STATUS_ORDER[self.status[idx]]
+
+    def set_status(self, idx: int, status: SegmentStatus) -> bool:
+        """修改单段状态，返回是否发生变化"""
+        code = STATUS_CODES[status]
+        if self.status[idx] == code:
+            return False
+        self.status[idx] = code
+        return True
+
+    def mark_range(self, start: int, end: int, status: SegmentStatus,
+                   only: SegmentStatus = SegmentStatus.PENDING) -> np.ndarray:
+        """把 [start, end) 内处于 only 状态的段落改为 status，返回被修改的段落编号"""
+        window = self.status[start:end]
+        mask = window == STATUS_CODES[only]
+        window[mask] = STATUS_CODES[status]
+        return np.flatnonzero(mask) + start
+
+    def ids_with(self, status: SegmentStatus) -> np.ndarray:
+        return np.flatnonzero(self.status == STATUS_CODES[status])
+
+    def any_with(self, status: SegmentStatus, start: int = 0, end: Optional[int] = None) -> bool:
+        return bool(np.any(self.status[start:end] == STATUS_CODES[status]))
+
+    def counts(self) -> Dict[SegmentStatus, int]:
+        bins = np.bincount(self.status, minlength=len(STATUS_ORDER))
+        return {status: int(bins[code]) for code, status in enumerate(STATUS_ORDER)}
+
+    # ---- API 边界视图 ----
+
+    def to_dicts(self) -> List[dict]:
+        """上传响应与 WebSocket snapshot 使用的段落列表"""
+        return [
+            {"id": i, "status": _STATUS_VALUES[code], "text": self.text(i)}
+            for i, code in enumerate(self.status.tolist())
+        ]
+
+
+class TrackingState:
+    """追踪状态：段落存储 + 当前位置 + 脱稿标记"""
+
+    def __init__(self, segments: SegmentStore):
+        self.segments = segments
+        self.current_idx = -1
+        self.is_free_style = False
@@ -0,0 +1,196 @@
+"""
+会话存储（main.py 与 main_lite.py 共用）
+Per-session presentation state with LRU/TTL eviction and a memory budget
+
+每次 /upload_script 签发一个 session_id，之后 /upload_ppt、/ws/speech、/ask_qa
+通过该 ID 访问各自独立的演讲状态，多位演讲者可以在同一进程内同时排练。
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# 会话参数（可通过环境变量调节）
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))  # 闲置 6 小时过期
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "500"))
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "1024"))
+
+_SCALAR_TYPES = (str, bytes, bytearray, int, float, bool, type(None))
+_SAMPLE_ITEMS = 64  # 长列表只抽样这么多项估算
+
+
+def estimate_size(obj) -> int:
+    """
+    粗略估算会话数据占用的内存（字节），不遍历组件内部的对象图：
+    - numpy 数组、Tracker、ScriptIndex 等组件通过 nbytes 自行上报（由数组长度直接算出）
+    - dict / list 等普通数据（段落列表、PPT 分析结果）逐项累加，长列表抽样估算
+    - 其他对象只计对象本身
+    """
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, _SCALAR_TYPES):
+        return size
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + size
+    if isinstance(obj, dict):
+        return size + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)) and len(obj) > _SAMPLE_ITEMS:
+        # 长列表（如轻量版的段落字典列表）等距抽样后按平均大小外推
+        step = len(obj) / _SAMPLE_ITEMS
+        sample = sum(estimate_size(obj[int(i * step)]) for i in range(_SAMPLE_ITEMS))
+        return size + sample * len(obj) // _SAMPLE_ITEMS
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item) for item in obj)
+    return size
+
+
+def public_session_id(session_id: str) -> str:
+    """
+    对外上报用的会话标识（哈希前缀）：session_id 是访问会话的唯一凭证，
+    /sessions、/health 等无鉴权接口不能返回原值
+    """
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+class Session:
+    """单个演讲者的状态：data 字典保存 tracker、演讲稿、PPT 分析等"""
+
+    def __init__(self, session_id: str, data: dict):
+        self.session_id = session_id
+        self.data = data
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.memory_bytes = 0
+
+    def touch(self):
+        self.last_access = time.time()
+
+    def refresh_memory(self) -> int:
+        """重新估算会话内存（数据变化后调用）"""
+        self.memory_bytes = estimate_size(self.data)
+        return self.memory_bytes
+
+    def info(self) -> dict:
+        now = time.time()
+        return {
+            "session": public_session_id(self.session_id),
+            "memory_bytes": self.memory_bytes,
+            "age_seconds": round(now - self.created_at, 1),
+            "idle_seconds": round(now - self.last_access, 1)
+        }
+
+
+class SessionStore:
+    """
+    会话存储：按最近使用排序（LRU），超过 TTL、数量上限或内存预算时淘汰最久未用的会话
+    """
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS,
+                 max_sessions: int = SESSION_MAX_COUNT,
+                 memory_budget_mb: float = SESSION_MEMORY_BUDGET_MB):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max(1, max_sessions)
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        # 会话被移除（过期或淘汰）时以 session_id 调用，用于清理按会话保存的附属状态
+        self._eviction_listeners: List[Callable[[str], None]] = []
+
+    def on_evict(self, listener: Callable[[str], None]):
+        """注册会话移除回调（在持锁状态下调用，回调应快速返回且不访问 SessionStore）"""
+        self._eviction_listeners.append(listener)
+
+    def create(self, data: dict) -> Session:
+        """签发新会话"""
+        session = Session(uuid.uuid4().hex, data)
+        session.refresh_memory()
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """按 ID 获取会话（过期则返回 None）"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if self._is_expired(session):
+                self._remove(session_id)
+                return None
+            session.touch()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def resolve(self, session_id: Optional[str]) -> Optional[Session]:
+        """
+        未携带 session_id 的旧客户端：只有进程内恰好一个会话时才退回该会话（兼容单用户用法），
+        有多个会话时返回 None，避免连到其他演讲者的会话
+        """
+        if session_id:
+            return self.get(session_id)
+        with self._lock:
+            only_id = next(iter(self._sessions)) if len(self._sessions) == 1 else None
+        return self.get(only_id) if only_id else None
+
+    def touch(self, session: Session):
+        """标记会话活跃（WebSocket 每条消息调用），推迟其被淘汰"""
+        with self._lock:
+            session.touch()
+            if session.session_id in self._sessions:
+                self._sessions.move_to_end(session.session_id)
+
+    def update_memory(self, session: Session):
+        """会话数据变化后重新估算内存并检查预算"""
+        session.refresh_memory()
+        with self._lock:
+            self._evict(keep=session.session_id)
+
+    def total_memory(self) -> int:
+        return sum(s.memory_bytes for s in self._sessions.values())
+
+    def stats(self) -> dict:
+        """会话数量与内存占用（用于 /sessions 上报）"""
+        with self._lock:
+            return {
+                "count": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "memory_bytes": self.total_memory(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+                "sessions": [s.info() for s in reversed(self._sessions.values())]
+            }
+
+    def _is_expired(self, session: Session) -> bool:
+        return self.ttl_seconds > 0 and time.time() - session.last_access > self.ttl_seconds
+
+    def _remove(self, session_id: str):
+        if self._sessions.pop(session_id, None) is not None:
+            for listener in self._eviction_listeners:
+                listener(session_id)
+
+    def _evict(self, keep: Optional[str] = None):
+        # 1. 清理过期会话
+        for session_id in [sid for sid, s in self._sessions.items() if self._is_expired(s)]:
+            self._remove(session_id)
+            self.evictions += 1
+
+        # 2. 超出数量或内存预算：从最久未用的开始淘汰（至少保留当前会话）
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions
+            or self.total_memory() > self.memory_budget_bytes
+        ):
+            oldest_id = next(iter(self._sessions))
+            if oldest_id == keep:
+                self._sessions.move_to_end(oldest_id)
+                oldest_id = next(iter(self._sessions))
+            self._remove(oldest_id)
+            self.evictions += 1
@@ -0,0 +1,234 @@
+"""
+问答预生成（完整版 main.py 使用，默认关闭：SPECULATIVE_QA=1 开启）
+Speculatively pre-generate likely Q&A answers while the talk is in progress
+
+真正在意问答延迟的时刻是演讲刚结束、教授开始提问时。开启后，演讲进行中每讲完
+（或跳过）一个章节（连续 SPECULATIVE_SECTION_SIZE 段），就在后台让 Gemini 预测
+教授可能提出的问题并给出回答，按问题向量写入语义缓存（qa_cache.py）。
+之后 /ask_qa 收到相近的问题时直接命中缓存，毫秒级返回。
+
+- 低优先级：单个后台任务串行执行；有前台问答请求进行中时暂停
+- 配额保护：限流令牌低于预留值时暂停，请求被限流时放弃本章节
+- 预算：每个会话最多调用 SPECULATIVE_BUDGET 次 Gemini，排队中的章节也计入，预算占满后不再排队
+- 演讲状态指纹变化（新增跳过段落）后缓存失效，相关章节会在预算内重新生成
+- 会话替换演讲稿或被淘汰（forget）后，该会话已排队的章节直接丢弃，语义缓存一并清除
+"""
+
+import asyncio
+import json
+import os
+import re
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List
+
+import numpy as np
+
+from gemini_client import GeminiUnavailable, get_gemini_client
+from models import SegmentStatus
+from processor import normalize_embeddings
+
+SPECULATIVE_QA = os.getenv("SPECULATIVE_QA", "0") == "1"
+SPECULATIVE_BUDGET = int(os.getenv("SPECULATIVE_BUDGET", "20"))            # 每个会话的 Gemini 调用上限
+SPECULATIVE_SECTION_SIZE = int(os.getenv("SPECULATIVE_SECTION_SIZE", "8"))  # 每个章节的段落数
+SPECULATIVE_QUESTIONS = int(os.getenv("SPECULATIVE_QUESTIONS", "3"))        # 每个章节预测的问题数
+SPECULATIVE_TOKEN_RESERVE = float(os.getenv("SPECULATIVE_TOKEN_RESERVE", "2"))  # 为前台保留的限流令牌数
+SPECULATIVE_IDLE_POLL_SECONDS = 0.5
+
+
+class SpeculativeQA:
+    """
+    后台预生成器：observe() 在每次位置更新后调用，发现新完成的章节即排队生成
+    """
+
+    def __init__(self, processor, cache, fingerprint_fn: Callable[[Any], str],
+                 enabled: bool = SPECULATIVE_QA, budget: int = SPECULATIVE_BUDGET,
+                 section_size: int = SPECULATIVE_SECTION_SIZE,
+                 questions_per_section: int = SPECULATIVE_QUESTIONS,
+                 token_reserve: float = SPECULATIVE_TOKEN_RESERVE):
+        self.processor = processor
+        self.cache = cache
+        self.fingerprint_fn = fingerprint_fn
+        self.enabled = enabled
+        self.budget = budget
+        self.section_size = max(1, section_size)
+        self.questions_per_section = questions_per_section
+        self.token_reserve = token_reserve
+        self._queue: "asyncio.Queue | None" = None
+        self._worker = None
+        self._foreground = 0
+        self._generated: Dict[str, Dict[int, str]] = {}  # session_id -> {章节: 生成时的指纹}
+        self._spent: Dict[str, int] = {}
+        self._queued: Dict[str, int] = {}
+        self._last_idx: Dict[str, int] = {}
+        # 每个会话一个令牌，随排队项一起保存；forget 后令牌失效，旧的排队项不再执行
+        self._tokens: Dict[str, object] = {}
+        self.stats_counters = {
+            "sections": 0, "questions": 0, "paused": 0, "rate_limited": 0, "failed": 0, "stale": 0
+        }
+
+    @contextmanager
+    def foreground(self):
+        """包裹前台问答请求：期间预生成暂停"""
+        self._foreground += 1
+        try:
+            yield
+        finally:
+            self._foreground -= 1
+
+    async def guard_stream(self, events: AsyncIterator[str]) -> AsyncIterator[str]:
+        """流式回答在响应返回后才开始生成，需要在整个流期间保持前台标记"""
+        with self.foreground():
+            async for event in events:
+                yield event
+
+    def observe(self, session):
+        """位置更新后调用：把新完成或含跳过段落的章节加入生成队列"""
+        if not self.enabled:
+            return
+        tracker = session.data["tracker"]
+        current = tracker.state.current_idx
+        sid = session.session_id
+        if self._last_idx.get(sid) == current:
+            return
+        self._last_idx[sid] = current
+        if self._remaining(sid) <= 0:
+            return
+
+        self._ensure_started()
+        token = self._tokens.setdefault(sid, object())
+        fingerprint = self.fingerprint_fn(session)
+        generated = self._generated.setdefault(sid, {})
+        segments = tracker.state.segments
+        for section in range((len(segments) + self.section_size - 1) // self.section_size):
+            if self._remaining(sid) <= 0:
+                break
+            start = section * self.section_size
+            end = min(start + self.section_size, len(segments))
+            finished = end <= current
+            has_skipped = segments.any_with(SegmentStatus.SKIPPED, start, end)
+            if (finished or has_skipped) and generated.get(section) != fingerprint:
+                generated[section] = fingerprint
+                self._queued[sid] = self._queued.get(sid, 0) + 1
+                self._queue.put_nowait((session, section, fingerprint, token))
+
+    def forget(self, session_id: str):
+        """
+        会话替换演讲稿或被淘汰后清除该会话的章节记录、预算与语义缓存；
+        令牌随之失效，已排队或正在生成的章节不会再调用 Gemini 或写入缓存
+        """
+        self._tokens.pop(session_id, None)
+        self._generated.pop(session_id, None)
+        self._spent.pop(session_id, None)
+        self._queued.pop(session_id, None)
+        self._last_idx.pop(session_id, None)
+        self.cache.drop_scope(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "budget_per_session": self.budget,
+            **self.stats_counters
+        }
+
+    def _remaining(self, sid: str) -> int:
+        """剩余预算：已调用与已排队的章节都计入"""
+        return self.budget - self._spent.get(sid, 0) - self._queued.get(sid, 0)
+
+    def _ensure_started(self):
+        # 队列与后台任务需要在事件循环内创建
+        if self._worker is None or self._worker.done():
+            self._queue = self._queue or asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def _wait_for_idle(self):
+        client = get_gemini_client()
+        while self._foreground > 0 or client.bucket.available < self.token_reserve + 1:
+            self.stats_counters["paused"] += 1
+            await asyncio.sleep(SPECULATIVE_IDLE_POLL_SECONDS)
+
+    async def _run(self):
+        while True:
+            session, section, fingerprint, token = await self._queue.get()
+            sid = session.session_id
+            if self._tokens.get(sid) is not token:
+                # 会话已替换演讲稿或被淘汰
+                self.stats_counters["stale"] += 1
+                continue
+            self._queued[sid] -= 1
+            try:
+                await self._wait_for_idle()
+                # 排队期间状态已变化（会在 observe 中重新排队）、会话被 forget 或预算用完：跳过
+                if (self._tokens.get(sid) is not token or self.fingerprint_fn(session) != fingerprint
+                        or self._spent.get(sid, 0) >= self.budget):
+                    continue
+                self._spent[sid] = self._spent.get(sid, 0) + 1
+                await self._generate(session, section, fingerprint, token)
+            except GeminiUnavailable:
+                self.stats_counters["rate_limited"] += 1
+            except Exception as e:
+                self.stats_counters["failed"] += 1
+                print(f"⚠️ 问答预生成失败: {e}")
+
+    async def _generate(self, session, section: int, fingerprint: str, token: object):
+        segments = session.data["tracker"].state.segments
+        start = section * self.section_size
+        section_ids = range(start, min(start + self.section_size, len(segments)))
+        skipped_count = segments.counts()[SegmentStatus.SKIPPED]
+
+        response = await get_gemini_client().agenerate_content(
+            self._build_prompt(segments, section_ids, session.data["ppt_analysis"].get("summary", ""))
+        )
+        pairs = parse_qa_pairs(response.text)[:self.questions_per_section]
+        if not pairs:
+            return
+
+        vecs = normalize_embeddings(np.asarray(
+            await self.processor.aget_embeddings([q for q, _ in pairs]), dtype=np.float32
+        ))
+        if self._tokens.get(session.session_id) is not token or self.fingerprint_fn(session) != fingerprint:
+            return  # 生成期间演讲状态已变化，或会话已被 forget
+        meta = {
+            "has_skipped_content": skipped_count > 0,
+            "skipped_count": skipped_count,
+            "context": {"mode": "speculative", "section": section}
+        }
+        for (question, answer), vec in zip(pairs, vecs):
+            self.cache.store(session.session_id, fingerprint, vec, answer, meta, adopt=True)
+        self.stats_counters["sections"] += 1
+        self.stats_counters["questions"] += len(pairs)
+
+    def _build_prompt(self, segments, section_ids, ppt_summary: str) -> str:
+        lines = "\n".join(f"[{segments.status_of(i).value.upper()}] {segments.text(i)}" for i in section_ids)
+        return f"""
+Role: 演讲辅助专家 - 一位大学生正在做 presentation，请预测教授在演讲结束后最可能针对下面这部分内容提出的 {self.questions_per_section} 个问题，并为每个问题给出回答建议。
+
+===== 本部分演讲内容（[SKIPPED] 为演讲中跳过的内容）=====
+{lines}
+
+===== PPT 背景信息 =====
+{ppt_summary[:600] or "未上传PPT"}
+
+===== 要求 =====
+如果问题涉及 [SKIPPED] 部分，回答开头用 ⚠️ 标记并提示："⚠️ 这部分内容刚才未讲到，建议您补充说明..."
+回答需简洁、专业，使用演讲者的口吻。
+
+只输出 JSON 数组，不要输出其他内容：
+[{{"question": "问题", "answer": "回答建议"}}]
+"""
+
+
+def parse_qa_pairs(text: str) -> List[tuple]:
+    """从模型输出中解析 [(问题, 回答)]（容忍 ```json 代码块等包裹）"""
+    match = re.search(r"\[.*\]", text, re.S)
+    if not match:
+        return []
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return []
+    return [
+        (item["question"].strip(), item["answer"].strip())
+        for item in items
+        if isinstance(item, dict) and item.get("question") and item.get("answer")
+    ]
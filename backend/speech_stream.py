@@ -0,0 +1,256 @@
+"""
+/ws/speech 全双工流水线（main.py 与 main_lite.py 共用）
+Full-duplex pipelined handler for the speech WebSocket
+
+每个连接拆成三个并发任务：
+- 接收任务：只读取客户端消息，转写放入合并器（transcripts.py），ping/pong 直接处理
+- 匹配任务：从合并器取每句话的最新转写，执行编码与匹配（调用方提供 match_fn）
+- 发送任务：从发件箱取待发送项，发送时才生成 delta（多次匹配合并成一条），空闲时发送心跳
+任务之间用有界队列连接：匹配落后时合并器只交出最新的 utterance、丢弃更早的，发送落后时位置更新合并为一条，
+慢客户端不会阻塞接收，慢编码也不会积压在 socket 缓冲区里。
+
+心跳：
+- 服务端空闲 SPEECH_PING_INTERVAL_SECONDS 秒发送 {"type": "ping", "t"}，客户端回 {"type": "pong", "t"}
+- 客户端也可发送 {"type": "ping", "t"}，服务端回 {"type": "pong", "t"}
+- SPEECH_IDLE_TIMEOUT_SECONDS 秒内未收到客户端任何消息则关闭连接
+
+消息编码（JSON / 二进制 delta）见 ws_codec.py。
+每个连接统计各阶段延迟（排队 / 匹配 / 发送 / 端到端 / 心跳往返），活动连接见 /health。
+"""
+
+import asyncio
+import itertools
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from protocol import UpdateStream, is_resync_request
+from sessions import public_session_id
+from transcripts import TranscriptCoalescer
+from ws_codec import MessageEncoder
+
+SPEECH_OUTBOX_SIZE = int(os.getenv("SPEECH_OUTBOX_SIZE", "8"))
+SPEECH_PING_INTERVAL_SECONDS = float(os.getenv("SPEECH_PING_INTERVAL_SECONDS", "20"))
+SPEECH_IDLE_TIMEOUT_SECONDS = float(os.getenv("SPEECH_IDLE_TIMEOUT_SECONDS", "60"))
+_LATENCY_WINDOW = 256  # 每个阶段保留最近的样本数
+
+_connection_ids = itertools.count(1)
+_active: Dict[int, "SpeechPipeline"] = {}
+
+
+class LatencyStats:
+    """单个阶段的延迟统计（保留最近 _LATENCY_WINDOW 个样本）"""
+
+    def __init__(self):
+        self.count = 0
+        self._samples = deque(maxlen=_LATENCY_WINDOW)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self._samples.append(seconds * 1000)
+
+    def summary(self) -> Dict[str, Any]:
+        if not self._samples:
+            return {"count": self.count}
+        ordered = sorted(self._samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(sum(ordered) / len(ordered), 1),
+            "p50_ms": round(ordered[len(ordered) // 2], 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            "max_ms": round(ordered[-1], 1)
+        }
+
+
+class SpeechPipeline:
+    """
+    单个 /ws/speech 连接
+    state_fn()：返回 (current_idx, is_free_style)
+    match_fn(text, is_final)：编码并匹配一条转写，更新追踪状态；可返回附加到 delta 的字段
+    （临时转写 is_final=False，调用方不应据此判定脱稿或跳读）
+    """
+
+    def __init__(self, websocket: WebSocket, stream: UpdateStream,
+                 state_fn: Callable[[], Tuple[int, bool]],
+                 match_fn: Callable[[str, bool], Awaitable[Optional[Dict[str, Any]]]],
+                 session_id: Optional[str] = None,
+                 encoding: str = "json",
+                 outbox_size: int = SPEECH_OUTBOX_SIZE,
+                 ping_interval: float = SPEECH_PING_INTERVAL_SECONDS,
+                 idle_timeout: float = SPEECH_IDLE_TIMEOUT_SECONDS):
+        self.websocket = websocket
+        self.stream = stream
+        self.state_fn = state_fn
+        self.match_fn = match_fn
+        self.session_id = session_id
+        self.connection_id = next(_connection_ids)
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.coalescer = TranscriptCoalescer()
+        self.encoder = MessageEncoder(encoding)
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=max(2, outbox_size))
+        self._update_queued = False
+        self._update_origin: Optional[float] = None  # 待发送更新中最早的转写到达时间
+        self._extra: Dict[str, Any] = {}
+        self._last_seen = time.monotonic()
+        self.connected_at = time.time()
+        self.latency = {
+            "queue": LatencyStats(),       # 转写到达 -> 匹配任务取出
+            "match": LatencyStats(),       # 编码 + 匹配
+            "send": LatencyStats(),        # 生成消息 + 写入 socket
+            "end_to_end": LatencyStats(),  # 转写到达 -> 更新发出
+            "heartbeat_rtt": LatencyStats()
+        }
+        self.counters = {"updates_sent": 0, "updates_coalesced": 0, "pongs_dropped": 0, "pings_sent": 0}
+
+    async def run(self):
+        """发送初始快照后运行三个任务，任一任务结束（断开、超时或出错）即关闭整个连接"""
+        _active[self.connection_id] = self
+        tasks = []
+        try:
+            await self._emit(self._snapshot())
+            tasks = [
+                asyncio.create_task(self._receive()),
+                asyncio.create_task(self._match()),
+                asyncio.create_task(self._send())
+            ]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    raise error
+            print(f"📴 WebSocket 连接 {self.connection_id} 已断开")
+        except WebSocketDisconnect:
+            print(f"📴 WebSocket 连接 {self.connection_id} 已断开")
+        except Exception as e:
+            print(f"❌ WebSocket 错误: {e}")
+            try:
+                await self._emit({"error": str(e)})
+                await self.websocket.close()
+            except Exception:
+                pass
+        finally:
+            _active.pop(self.connection_id, None)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connection_id": self.connection_id,
+            "session": public_session_id(self.session_id) if self.session_id else None,
+            "connected_seconds": round(time.time() - self.connected_at, 1),
+            "encoding": self.encoder.encoding,
+            "transcripts": dict(self.coalescer.stats),
+            **self.counters,
+            "frames_sent": self.encoder.frames,
+            "bytes_sent": self.encoder.bytes_sent,
+            "latency": {stage: s.summary() for stage, s in self.latency.items()}
+        }
+
+    # ---- 接收 ----
+
+    async def _receive(self):
+        try:
+            while True:
+                data = await self.websocket.receive_json()
+                self._last_seen = time.monotonic()
+                kind = data.get("type") if isinstance(data, dict) else None
+                if kind == "ping":
+                    self._post_pong(data.get("t"))
+                elif kind == "pong":
+                    sent = data.get("t")
+                    if isinstance(sent, (int, float)):
+                        self.latency["heartbeat_rtt"].add(max(0.0, time.time() - sent / 1000))
+                elif is_resync_request(data):
+                    self.coalescer.request_resync()
+                elif isinstance(data, dict):
+                    self.coalescer.put(data)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.coalescer.close()
+
+    # ---- 匹配 ----
+
+    async def _match(self):
+        while True:
+            item = await self.coalescer.get()
+            if item is None:
+                return
+            if item["type"] == "resync":
+                await self._outbox.put(("snapshot", None))
+                continue
+
+            picked = time.monotonic()
+            self.latency["queue"].add(picked - item["updated_at"])
+            extra = await self.match_fn(item["text"], item["is_final"])
+            self.latency["match"].add(time.monotonic() - picked)
+
+            self._extra = extra or {}
+            if self._update_origin is None:
+                self._update_origin = item["updated_at"]
+            if self._update_queued:
+                # 上一条更新尚未发出：发送时按最新状态生成，一条 delta 即包含本次变化
+                self.counters["updates_coalesced"] += 1
+            else:
+                self._update_queued = True
+                await self._outbox.put(("update", None))
+
+    def _post_pong(self, t):
+        try:
+            self._outbox.put_nowait(("pong", t))
+        except asyncio.QueueFull:
+            self.counters["pongs_dropped"] += 1  # 客户端会在下个周期重试
+
+    # ---- 发送 ----
+
+    async def _send(self):
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(self._outbox.get(), self.ping_interval)
+            except asyncio.TimeoutError:
+                if time.monotonic() - self._last_seen > self.idle_timeout:
+                    print(f"⏱️ WebSocket 连接 {self.connection_id} 心跳超时")
+                    await self.websocket.close(code=1001)
+                    return
+                await self._emit({"type": "ping", "t": int(time.time() * 1000)})
+                self.counters["pings_sent"] += 1
+                continue
+
+            started = time.monotonic()
+            if kind == "update":
+                # 延迟到发送时才生成 delta
+                self._update_queued = False
+                origin, self._update_origin = self._update_origin, None
+                message = self.stream.update(*self.state_fn(), **self._extra)
+            elif kind == "snapshot":
+                message = self._snapshot()
+            else:
+                message = {"type": "pong", "t": payload}
+
+            await self._emit(message)
+            finished = time.monotonic()
+            self.latency["send"].add(finished - started)
+            if kind == "update":
+                self.counters["updates_sent"] += 1
+                if origin is not None:
+                    self.latency["end_to_end"].add(finished - origin)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # 告知客户端协商结果：旧服务端不返回该字段，客户端按 JSON 处理
+        return self.stream.snapshot(*self.state_fn(), encoding=self.encoder.encoding)
+
+    async def _emit(self, message: Dict[str, Any]):
+        await self.encoder.send(self.websocket, message)
+
+
+def speech_stats() -> Dict[str, Any]:
+    """活动连接及其各阶段延迟（用于 /health）"""
+    return {
+        "connections": len(_active),
+        "per_connection": [p.stats() for p in list(_active.values())]
+    }
@@ -0,0 +1,226 @@
+"""
+轻量级文本索引（用于 main_lite 的实时匹配）
+Lightweight text index for the lite WebSocket matcher
+
+纯 Python 实现，不依赖 numpy 等大型库，适合 Railway 免费版部署。
+上传演讲稿时构建一次，之后每次语音识别结果只需线性时间即可完成匹配。
+"""
+
+import math
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# 匹配参数（可调节）
+MATCH_THRESHOLD = 0.5  # 50% 相似度即可匹配
+MIN_MATCH_LENGTH = 3   # 至少匹配 3 个字符
+SEED_LENGTH = MIN_MATCH_LENGTH  # 最长公共子串的种子长度，不能超过 MIN_MATCH_LENGTH
+
+# 候选剪枝参数
+NGRAM_SIZES = (2, 3)   # 字符 bigram + trigram（中文无空格，不能按词切分）
+# 每次最多精确打分的候选段落数（按最长公共子串排序）；0 表示不截断（默认，与全量扫描结果完全一致），
+# 设置上限后常用词极多的超长演讲稿更快，但排在上限之外的段落不会被匹配
+MAX_CANDIDATES = int(os.getenv("MATCH_MAX_CANDIDATES", "0"))
+
+_CLEAN_PATTERN = re.compile(r'[，。！？；：、\s,\.!?;:\s]+')
+_SEPARATOR = "\n"  # 段落分隔符：normalize_text 会去掉空白，清洗后的文本中不会出现
+
+
+def normalize_text(text: str) -> str:
+    """预处理文本：转小写并去除标点和空格"""
+    return _CLEAN_PATTERN.sub('', text.lower())
+
+
+def char_ngrams(text: str, sizes=NGRAM_SIZES) -> List[str]:
+    """提取字符 n-gram（输入应为 normalize_text 清洗后的文本）"""
+    grams = []
+    for n in sizes:
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class ScriptIndex:
+    """
+    演讲稿匹配索引：所有段落清洗后用分隔符拼接成一个字符串，另存
+    - offsets：每个段落的起始位置；segment_of：每个位置所属的段落编号
+    - positions：段内每个 bigram 起点按其后三个字符排序的位置数组（q-gram 数组），
+      同一 bigram / 三字组的出现位置连续存放，二分即可取出，相当于不单独保存倒排链的 n-gram 倒排索引
+    匹配时用语音的每个三字组在 positions 中二分，再逐个向后延伸，一趟即得到语音与各段落的最长公共子串，
+    同时得到候选段落，代价只取决于命中的位置数；问答检索的 BM25 也从同一数组现场统计词频。
+    数组均为 array（每个字符约 8 字节），上传演讲稿时构建一次
+    """
+
+    def __init__(self, texts: List[str], max_candidates: int = MAX_CANDIDATES):
+        clean_texts = [normalize_text(t) for t in texts]
+        # 末尾也加分隔符：向后延伸时一定先遇到分隔符，无需判断越界
+        self.script = "".join(t + _SEPARATOR for t in clean_texts)
+        self.offsets = array("I", [0])
+        self.segment_of = array("I")
+        for seg_id, text in enumerate(clean_texts):
+            self.offsets.append(self.offsets[-1] + len(text) + 1)
+            self.segment_of.extend([seg_id] * (len(text) + 1))
+
+        # 按三字符排序同时也按前两个字符有序，bigram 与三字组都能在同一数组上二分
+        script = self.script
+        min_gram = min(NGRAM_SIZES)
+        self.positions = array("I", sorted(
+            (p for seg_id, text in enumerate(clean_texts)
+             for p in range(self.offsets[seg_id], self.offsets[seg_id] + len(text) - min_gram + 1)),
+            key=lambda p: script[p:p + SEED_LENGTH]
+        ))
+        self.max_candidates = max_candidates
+        self.avg_gram_count = (
+            sum(self._gram_count(i) for i in range(len(clean_texts))) / len(clean_texts)
+        ) if clean_texts else 0.0
+
+        # 清洗后不足一个三字组的段落不会被三字组命中，始终作为候选
+        self.short_segments = [i for i, t in enumerate(clean_texts) if len(t) < SEED_LENGTH]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """索引占用的内存：拼接文本 + 各数组缓冲区"""
+        arrays = (self.offsets, self.segment_of, self.positions)
+        return (sys.getsizeof(self.script) + sum(len(a) * a.itemsize for a in arrays)
+                + sys.getsizeof(self.short_segments))
+
+    def text(self, idx: int) -> str:
+        """第 idx 段清洗后的文本"""
+        return self.script[self.offsets[idx]:self.offsets[idx + 1] - 1]
+
+    def _gram_count(self, idx: int) -> int:
+        """第 idx 段的 n-gram 总数（BM25 的文档长度）"""
+        length = self.offsets[idx + 1] - self.offsets[idx] - 1
+        return sum(max(0, length - n + 1) for n in NGRAM_SIZES)
+
+    def _occurrences(self, gram: str) -> array:
+        """gram（长度在 NGRAM_SIZES 内）在演讲稿中的全部出现位置"""
+        script = self.script
+        n = len(gram)
+        key = lambda p: script[p:p + n]
+        lo = bisect_left(self.positions, gram, key=key)
+        hi = bisect_right(self.positions, gram, lo=lo, key=key)
+        return self.positions[lo:hi]
+
+    def search(self, query_clean: str, limit: Optional[int] = None,
+               k1: float = 1.2, b: float = 0.75) -> List[Tuple[int, float]]:
+        """
+        BM25 检索（字符 bigram + trigram，main_lite 问答检索模式使用）
+        返回与查询共享 n-gram 的段落 [(段落索引, BM25 分数)]，按分数降序
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        total_docs = len(self)
+        avg_len = self.avg_gram_count or 1.0
+
+        for gram, qtf in Counter(char_ngrams(query_clean)).items():
+            tf_by_doc = Counter(self.segment_of[p] for p in self._occurrences(gram))
+            if not tf_by_doc:
+                continue
+            df = len(tf_by_doc)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in tf_by_doc.items():
+                norm = k1 * (1 - b + b * self._gram_count(doc_id) / avg_len)
+                scores[doc_id] += qtf * idf * tf * (k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    def common_substrings(self, speech_clean: str) -> Dict[int, int]:
+        """
+        返回 {段落索引: 与语音的最长公共子串长度}，只包含公共子串不短于 SEED_LENGTH 的段落
+        （任何这样的公共子串都以一个共享三字组开头，所以结果是精确的）
+        """
+        script = self.script
+        segment_of = self.segment_of
+        best: Dict[int, int] = {}
+        m = len(speech_clean)
+
+        for i in range(m - SEED_LENGTH + 1):
+            for p in self._occurrences(speech_clean[i:i + SEED_LENGTH]):
+                # 前一个字符也相同：这次命中已被更早的起点覆盖
+                if i and script[p - 1] == speech_clean[i - 1]:
+                    continue
+                k = SEED_LENGTH
+                while i + k < m and script[p + k] == speech_clean[i + k]:
+                    k += 1
+                seg_id = segment_of[p]
+                if k > best.get(seg_id, 0):
+                    best[seg_id] = k
+
+        return best
+
+    def similarity(self, idx: int, speech_clean: str, speech_chars: set, lcs: int) -> float:
+        """
+        计算清洗后的语音文本与第 idx 段的相似度（lcs 取自 common_substrings，没有共享三字组时为 0）
+        评分规则与原先逐段扫描的实现一致：
+        1. 包含关系 -> 1.0
+        2. 否则：字符重叠比例 * 0.3 + 最长公共子串比例 * 0.7
+        """
+        text_clean = self.text(idx)
+
+        # 方法1: 简单包含关系（公共子串覆盖了较短的一方；短于三字组的一方直接查子串）
+        shorter, longer = sorted((speech_clean, text_clean), key=len)
+        if lcs >= len(shorter) or (len(shorter) < SEED_LENGTH and shorter in longer):
+            return 1.0
+
+        # 方法2: 字符重叠比例
+        text_chars = set(text_clean)
+        common_chars = speech_chars & text_chars
+        if not common_chars or lcs < MIN_MATCH_LENGTH:
+            return 0.0
+
+        overlap_ratio = len(common_chars) / max(len(speech_chars), len(text_chars))
+        substr_ratio = lcs / len(text_clean)
+        return overlap_ratio * 0.3 + substr_ratio * 0.7
+
+    def candidates(self, speech_clean: str, lcs: Dict[int, int]) -> List[int]:
+        """
+        候选剪枝：只返回与语音共享三字组的段落（lcs 的键）和不足一个三字组的短段落
+        得分非 0 要求最长公共子串不短于 MIN_MATCH_LENGTH，或较短的一方整体包含在另一方中，
+        因此不截断（max_candidates 为 0）时剪枝是无损的；
+        设置了上限时只保留最长公共子串最长的前 max_candidates 个（有损）
+        """
+        if len(speech_clean) < SEED_LENGTH:
+            # 语音过短没有三字组，退化为全量扫描（只可能命中包含关系）
+            return list(range(len(self)))
+
+        docs = lcs.keys()
+        if self.max_candidates and len(lcs) > self.max_candidates:
+            docs = sorted(lcs, key=lambda idx: (-lcs[idx], idx))[:self.max_candidates]
+        return sorted(set(docs).union(self.short_segments))
+
+    def match(self, speech_text: str, threshold: float = MATCH_THRESHOLD) -> Tuple[int, float]:
+        """
+        返回 (最佳匹配段落索引, 相似度)，未达到阈值时索引为 -1
+        """
+        speech_clean = normalize_text(speech_text)
+        if not speech_clean:
+            return -1, 0.0
+
+        speech_chars = set(speech_clean)
+        lcs = self.common_substrings(speech_clean)
+        matched_idx = -1
+        max_similarity = 0.0
+
+        # 候选按段落顺序打分，平分时仍优先靠前的段落（与全量扫描一致）
+        for idx in self.candidates(speech_clean, lcs):
+            if max_similarity >= 1.0:
+                break  # 已有包含关系（满分），后面的段落平分也不会替换
+            common = lcs.get(idx, 0)
+            if SEED_LENGTH <= common < len(speech_clean):
+                # 语音不被包含时得分不超过 0.3 + 最长公共子串比例 * 0.7，达不到阈值或当前最高分就不必精确打分
+                bound = 0.3 + common / (self.offsets[idx + 1] - self.offsets[idx] - 1) * 0.7
+                if bound < threshold or bound <= max_similarity:
+                    continue
+            similarity = self.similarity(idx, speech_clean, speech_chars, common)
+            if similarity > max_similarity and similarity >= threshold:
+                max_similarity = similarity
+                matched_idx = idx
+
+        return matched_idx, max_similarity
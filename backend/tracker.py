@@ -1,13 +1,41 @@
-from typing import List
-from models import SegmentStatus, ScriptSegment, PresentationState
-from processor import calculate_similarity
+import os
+from typing import List, Tuple
+from models import SegmentStatus
+from processor import normalize_embeddings
+from protocol import StatusJournal
+from ann_index import build_index
+from segment_store import SegmentStore, TrackingState
 import numpy as np
 from collections import deque
 
+# 分层搜索：先搜当前位置附近的窗口，未达到高置信度再向外扩一圈，最后才全局搜索
+# （长演讲稿的全局搜索走近似最近邻索引 "ann"，否则全量扫描 "global"）
+TRACKER_RING_SIZE = int(os.getenv("TRACKER_RING_SIZE", "64"))  # 第二层在窗口两侧各扩展的段落数
+SEARCH_TIERS = ("local", "ring", "global", "ann")
+
+# 所有会话累计的分层命中次数（/health 上报）
+_tier_totals = {tier: 0 for tier in SEARCH_TIERS}
+
+
+def search_stats() -> dict:
+    total = sum(_tier_totals.values())
+    return {
+        "searches": total,
+        **{f"{tier}_exits": count for tier, count in _tier_totals.items()},
+        "local_exit_rate": round(_tier_totals["local"] / total, 3) if total else 0.0
+    }
+
+
 class Tracker:
-    def __init__(self, segments: List[ScriptSegment], embeddings: np.ndarray):
-        self.state = PresentationState(segments=segments)
-        self.embeddings = embeddings
+    def __init__(self, texts: List[str], embeddings: np.ndarray):
+        # 列式存储：状态数组 + 文本缓冲区 + 预归一化向量矩阵（上传时构建一次），
+        # 匹配时只需一次矩阵-向量乘法
+        self.state = TrackingState(SegmentStore(texts, embeddings))
+        # 长演讲稿：构建近似最近邻索引，追踪丢失时用于全局重新定位（段落较少时为 None）
+        self.ann_index = build_index(self.normed_embeddings)
+        
+        # 状态变更日志：WebSocket 只推送增量
+        self.journal = StatusJournal()
         
         # 用户体验优化：动态阈值
         self.threshold_high = 0.75  # 高置信度匹配（降低以适应口语化表达）
@@ -17,27 +45,43 @@ class Tracker:
         self.recent_matches = deque(maxlen=3)  # 保留最近3次匹配结果
         self.free_style_counter = 0  # 连续低相似度计数
         self.free_style_threshold = 3  # 连续3次才判定为Free Style
+        
+        # 分层搜索窗口：current-2 ~ current+15，其次两侧各扩 ring_size 段
+        self.window_behind = 2
+        self.window_ahead = 15
+        self.ring_size = TRACKER_RING_SIZE
+        self.tier_counts = {tier: 0 for tier in SEARCH_TIERS}  # 每次匹配在哪一层结束
+
+    @property
+    def normed_embeddings(self) -> np.ndarray:
+        return self.state.segments.normed_embeddings
 
-    def process_speech_vector(self, speech_vec: np.ndarray) -> PresentationState:
+    @property
+    def nbytes(self) -> int:
+        """会话内存统计用：段落存储 + 近似最近邻索引 + 变更日志"""
+        ann_bytes = self.ann_index.nbytes if self.ann_index is not None else 0
+        return self.state.segments.nbytes + ann_bytes + self.journal.nbytes
+
+    def process_speech_vector(self, speech_vec: np.ndarray, is_final: bool = True) -> TrackingState:
         """
         优化的追踪逻辑：
         1. 优先搜索当前位置附近（性能优化）
         2. 平滑处理（避免抖动）
         3. 智能Free Style判断（避免误触发）
+        is_final=False（说到一半的临时转写）只用于把位置推进到当前或下一段，
+        不计入匹配历史与脱稿计数，也不做跳读标记（半句话相似度偏低，容易误判）
         """
-        best_sim = -1
-        best_idx = -1
-        
-        # 优化1：优先搜索当前附近的段落（±5范围）
-        search_range = self._get_smart_search_range()
-        
-        for i in search_range:
-            if i < 0 or i >= len(self.embeddings):
-                continue
-            sim = calculate_similarity(speech_vec, self.embeddings[i])
-            if sim > best_sim:
-                best_sim = sim
-                best_idx = i
+        # 优化1：分层搜索，常见情况（正在读下一句）只需对窗口内的段落打分
+        best_idx, best_sim = self._tiered_search(speech_vec)
+
+        if not is_final:
+            prev_idx = self.state.current_idx
+            if best_sim > self.threshold_high and prev_idx >= 0 and prev_idx <= best_idx <= prev_idx + 1:
+                self._set_status(best_idx, SegmentStatus.COVERED)
+                self.state.current_idx = best_idx
+                self.state.is_free_style = False
+                self.journal.commit()
+            return self.state
 
         # 记录匹配历史
         self.recent_matches.append((best_idx, best_sim))
@@ -59,36 +103,92 @@ class Tracker:
             # 平滑处理：如果连续匹配到同一位置，才确认跳转
             if self._is_stable_match(best_idx):
                 # 标记当前段落为 COVERED
-                self.state.segments[best_idx].status = SegmentStatus.COVERED
+                self._set_status(best_idx, SegmentStatus.COVERED)
                 
-                # 跳读检测：向前跳跃超过1段
+                # 跳读检测：向前跳跃超过1段，中间仍未讲的段落一次切片标记为 SKIPPED
                 if prev_idx >= 0 and best_idx > prev_idx + 1:
-                    for j in range(prev_idx + 1, best_idx):
-                        if self.state.segments[j].status == SegmentStatus.PENDING:
-                            self.state.segments[j].status = SegmentStatus.SKIPPED
+                    skipped = self.state.segments.mark_range(prev_idx + 1, best_idx, SegmentStatus.SKIPPED)
+                    for j in skipped.tolist():
+                        self.journal.record(j, SegmentStatus.SKIPPED.value)
                 
                 # 更新当前位置
                 self.state.current_idx = best_idx
+                self.journal.commit()
             
         return self.state
     
-    def _get_smart_search_range(self) -> List[int]:
-        """智能搜索范围：优先搜索当前附近"""
-        current = self.state.current_idx
-        total = len(self.embeddings)
+    def _set_status(self, idx: int, status: SegmentStatus):
+        """修改段落状态并记录到变更日志"""
+        if self.state.segments.set_status(idx, status):
+            self.journal.record(idx, status.value)
+    
+    def _tiered_search(self, speech_vec: np.ndarray) -> Tuple[int, float]:
+        """
+        分层搜索（只对连续切片做矩阵-向量乘法，不构造全量下标数组）：
+        1. local：current-2 ~ current+15，最高分超过 threshold_high 即结束
+        2. ring：窗口两侧各扩 ring_size 段
+        3. global / ann：其余所有段落，有索引时探测最相近的几个簇再精确重排
+           （初始状态 current_idx == -1 时直接全局搜索）
+        各层依次比较、严格大于才替换，因此平分时靠近当前位置的段落优先
+        """
+        total = len(self.state.segments)
+        if total == 0:
+            return -1, -1
         
+        query = normalize_embeddings(speech_vec)[0]
+        current = self.state.current_idx
         if current < 0:
-            # 初始状态：全局搜索
-            return list(range(total))
+            return self._relocalize(query, (-1, -1), (0, total))
+        
+        start = max(0, current - self.window_behind)
+        end = min(total, current + self.window_ahead)
+        best_idx, best_sim = self._score_slice(query, start, end)
+        if best_sim > self.threshold_high:
+            self._count_tier("local")
+            return best_idx, best_sim
+        
+        ring_start = max(0, start - self.ring_size)
+        ring_end = min(total, end + self.ring_size)
+        best_idx, best_sim = self._best_of(query, (best_idx, best_sim),
+                                           (ring_start, start), (end, ring_end))
+        if best_sim > self.threshold_high:
+            self._count_tier("ring")
+            return best_idx, best_sim
         
-        # 优先搜索 current ± 10 的范围，然后扩展到全局
-        nearby_range = list(range(max(0, current - 2), min(total, current + 15)))
-        full_range = list(range(total))
+        return self._relocalize(query, (best_idx, best_sim), (0, ring_start), (ring_end, total))
+    
+    def _relocalize(self, query: np.ndarray, best: Tuple[int, float], *ranges) -> Tuple[int, float]:
+        """全局搜索：有索引时近似搜索整篇，否则全量扫描剩余区间"""
+        if self.ann_index is None:
+            self._count_tier("global")
+            return self._best_of(query, best, *ranges)
         
-        # 去重并保持nearby优先
-        seen = set(nearby_range)
-        result = nearby_range + [i for i in full_range if i not in seen]
-        return result
+        self._count_tier("ann")
+        idx, sim = self.ann_index.search(query)
+        return (idx, sim) if sim > best[1] else best
+    
+    def _best_of(self, query: np.ndarray, best: Tuple[int, float], *ranges) -> Tuple[int, float]:
+        best_idx, best_sim = best
+        for start, end in ranges:
+            idx, sim = self._score_slice(query, start, end)
+            if sim > best_sim:
+                best_idx, best_sim = idx, sim
+        return best_idx, best_sim
+    
+    def _score_slice(self, query: np.ndarray, start: int, end: int) -> Tuple[int, float]:
+        """
+        对 [start, end) 的连续切片打分：一次矩阵-向量乘法 + argmax（切片是视图，不复制向量）
+        argmax 取第一个最大值，区间为空时返回 (-1, -1)
+        """
+        if end <= start:
+            return -1, -1
+        scores = self.normed_embeddings[start:end] @ query
+        best = int(np.argmax(scores))
+        return start + best, float(scores[best])
+    
+    def _count_tier(self, tier: str):
+        self.tier_counts[tier] += 1
+        _tier_totals[tier] += 1
     
     def _is_stable_match(self, idx: int) -> bool:
         """判断匹配是否稳定（避免抖动）"""
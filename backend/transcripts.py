@@ -0,0 +1,137 @@
+"""
+语音转写合并（main.py 与 main_lite.py 共用）
+Coalesce interim speech transcripts before matching
+
+前端开启 interimResults 后，同一句话会先后发来多条中间结果（interim），最后一条为定稿（final）。
+消息格式：{"text": "...", "utterance_id": "3-0", "is_final": false}
+- 接收与匹配分离：接收任务只负责入队，匹配循环每次只取每个 utterance 的最新文本
+- 匹配落后（积压多个 utterance）时只处理最新一条已可处理的 utterance，更早的直接丢弃；
+  待处理的 utterance 最多 SPEECH_MAX_PENDING 条
+- 同一 utterance 的旧文本被新文本覆盖后直接丢弃；定稿之后迟到的中间结果也丢弃
+- 中间结果去抖：INTERIM_DEBOUNCE_MS 内无新文本才处理，但最长不超过 INTERIM_MAX_DELAY_MS；
+  定稿立即处理
+- 未携带 utterance_id 的旧客户端消息按定稿处理，行为与之前一致
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+INTERIM_DEBOUNCE_MS = int(os.getenv("INTERIM_DEBOUNCE_MS", "120"))
+INTERIM_MAX_DELAY_MS = int(os.getenv("INTERIM_MAX_DELAY_MS", "400"))
+SPEECH_MAX_PENDING = int(os.getenv("SPEECH_MAX_PENDING", "4"))  # 待匹配 utterance 上限
+_FINALIZED_HISTORY = 256  # 记住最近定稿的 utterance，用于丢弃迟到的中间结果
+
+
+class TranscriptCoalescer:
+    """
+    按 utterance 合并转写文本（单事件循环内使用）
+    put() 由接收任务调用，get() 由匹配任务调用（见 speech_stream.py）
+    """
+
+    def __init__(self, debounce_ms: int = INTERIM_DEBOUNCE_MS, max_delay_ms: int = INTERIM_MAX_DELAY_MS,
+                 max_pending: int = SPEECH_MAX_PENDING):
+        self.debounce = debounce_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.max_pending = max(1, max_pending)
+        self._pending: "OrderedDict[str, Dict]" = OrderedDict()  # utterance_id -> 最新文本
+        self._finalized = deque(maxlen=_FINALIZED_HISTORY)
+        self._event = asyncio.Event()
+        self._resync = False
+        self._closed = False
+        self._legacy_seq = 0
+        self.stats = {"received": 0, "processed": 0, "superseded": 0, "stale": 0, "dropped": 0}
+
+    def put(self, data: dict):
+        """收到一条转写（中间结果或定稿）"""
+        text = str(data.get("text", "")).strip()
+        if not text:
+            return
+        self.stats["received"] += 1
+
+        utterance_id = data.get("utterance_id")
+        if utterance_id is None:
+            self._legacy_seq += 1
+            utterance_id, is_final = f"legacy-{self._legacy_seq}", True
+        else:
+            utterance_id, is_final = str(utterance_id), bool(data.get("is_final", False))
+
+        if utterance_id in self._finalized:
+            self.stats["stale"] += 1
+            return
+
+        now = time.monotonic()
+        previous = self._pending.get(utterance_id)
+        if previous is not None:
+            self.stats["superseded"] += 1
+        self._pending[utterance_id] = {
+            "type": "transcript",
+            "utterance_id": utterance_id,
+            "text": text,
+            "is_final": is_final,
+            "updated_at": now,
+            "pending_since": previous["pending_since"] if previous else now
+        }
+        if is_final:
+            self._finalized.append(utterance_id)
+        # 匹配跟不上时丢弃最旧的 utterance，保证始终处理最新的语音
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self.stats["dropped"] += 1
+        self._event.set()
+
+    def request_resync(self):
+        self._resync = True
+        self._event.set()
+
+    def close(self):
+        """连接断开：未处理的转写不再匹配"""
+        self._closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[Dict]:
+        """
+        取下一条待匹配的转写（按 utterance 先后）或重新同步请求；连接关闭后返回 None
+        """
+        while True:
+            self._event.clear()
+            if self._closed:
+                return None
+            if self._resync:
+                self._resync = False
+                return {"type": "resync"}
+
+            item, wait = self._next_ready()
+            if item is not None:
+                self.stats["processed"] += 1
+                return item
+
+            try:
+                await asyncio.wait_for(self._event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _next_ready(self):
+        """
+        返回 (可处理的条目, None) 或 (None, 最新一条到期还需等待的秒数)
+        从最新的 utterance 往前找第一条可处理的（定稿、去抖到期，或后面已有新的 utterance
+        说明这一句已经说完），比它更早的 utterance 已过时，直接丢弃
+        """
+        if not self._pending:
+            return None, None
+        now = time.monotonic()
+        ids = list(self._pending)
+        for pos in range(len(ids) - 1, -1, -1):
+            item = self._pending[ids[pos]]
+            if pos < len(ids) - 1 or item["is_final"] or self._due(item) <= now:
+                for stale_id in ids[:pos + 1]:
+                    del self._pending[stale_id]
+                self.stats["dropped"] += pos
+                return item, None
+        return None, self._due(self._pending[ids[-1]]) - now
+
+    def _due(self, item: Dict) -> float:
+        return min(item["updated_at"] + self.debounce, item["pending_since"] + self.max_delay)
+
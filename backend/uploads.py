@@ -0,0 +1,30 @@
+"""
+上传文件落盘（main.py 与 main_lite.py 共用）
+Stream uploaded files to disk in fixed-size chunks
+"""
+
+import os
+import tempfile
+
+from fastapi import UploadFile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 每次读取 1 MB
+
+
+async def save_upload_to_disk(file: UploadFile, suffix: str = "") -> str:
+    """
+    分块把上传文件写入临时文件，返回文件路径（调用方负责删除）
+    内存占用固定为一个分块，不再用 await file.read() 整体缓冲
+    """
+    fd, file_path = tempfile.mkstemp(prefix="upload_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+    except Exception:
+        os.remove(file_path)
+        raise
+    return file_path
@@ -0,0 +1,88 @@
+"""
+/ws/speech 消息编码（main.py 与 main_lite.py 共用）
+Compact encodings for speech WebSocket frames
+
+连接时通过查询参数协商：/ws/speech?encoding=binary（默认 json）
+- json：文本帧；安装了 orjson 时用 orjson 序列化，否则用标准库（紧凑分隔符）
+- binary：delta 以二进制帧发送，固定布局（小端序）：
+    头部 16 字节：type u8 | flags u8 | change_count u16 | current_idx i32 | base_version u32 | version u32
+    之后 change_count 个段落 id（i32），再 change_count 个状态字节（u8，见 STATUS_CODES）
+    flags：bit0 脱稿，bit1 携带 matched 字段，bit2 matched 取值
+  snapshot、心跳与错误消息仍为 JSON 文本帧（snapshot 含 "encoding" 字段告知客户端协商结果）
+初始 snapshot 含演讲稿全文，由 uvicorn 的 permessage-deflate 压缩（启动参数 --ws-per-message-deflate）。
+"""
+
+import json
+import struct
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket
+
+from models import STATUS_ORDER
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ENCODINGS = ("json", "binary")
+# 与 segment_store.STATUS_CODES 同源（models.STATUS_ORDER），按状态字符串索引；
+# 不直接导入 segment_store：它依赖 numpy / 句向量模型，轻量版无法加载
+STATUS_CODES = {status.value: code for code, status in enumerate(STATUS_ORDER)}
+
+BINARY_DELTA = 1
+FLAG_FREE_STYLE = 1
+FLAG_HAS_MATCHED = 2
+FLAG_MATCHED = 4
+_HEADER = struct.Struct("<BBHiII")
+_MAX_CHANGES = 0xFFFF
+
+
+def dumps(message: Dict[str, Any]) -> str:
+    """JSON 序列化（优先 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_delta(message: Dict[str, Any]) -> Optional[bytes]:
+    """把 delta 消息编码为二进制帧；包含无法表示的字段时返回 None（调用方改发 JSON）"""
+    changes = message["changes"]
+    if len(changes) > _MAX_CHANGES or any(c["status"] not in STATUS_CODES for c in changes):
+        return None
+
+    flags = FLAG_FREE_STYLE if message["is_free_style"] else 0
+    if "matched" in message:
+        flags |= FLAG_HAS_MATCHED | (FLAG_MATCHED if message["matched"] else 0)
+    count = len(changes)
+    return b"".join((
+        _HEADER.pack(BINARY_DELTA, flags, count, message["current_idx"],
+                     message["base_version"], message["version"]),
+        struct.pack(f"<{count}i", *(c["id"] for c in changes)),
+        bytes(STATUS_CODES[c["status"]] for c in changes)
+    ))
+
+
+class MessageEncoder:
+    """单个连接的消息编码器，记录发送的帧数与字节数"""
+
+    def __init__(self, encoding: str = "json"):
+        self.encoding = encoding if encoding in ENCODINGS else "json"
+        self.frames = 0
+        self.bytes_sent = 0
+
+    async def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        if self.encoding == "binary" and message.get("type") == "delta":
+            frame = encode_delta(message)
+            if frame is not None:
+                await websocket.send_bytes(frame)
+                self._count(len(frame))
+                return
+
+        text = dumps(message)
+        await websocket.send_text(text)
+        self._count(len(text.encode("utf-8")))
+
+    def _count(self, size: int):
+        self.frames += 1
+        self.bytes_sent += size
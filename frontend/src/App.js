@@ -10,10 +10,12 @@ import './App.css';
 
 function App() {
   const [segments, setSegments] = useState([]);
+  const [sessionId, setSessionId] = useState(null);
   const [uploadStatus, setUploadStatus] = useState({ script: false, ppt: false });
 
-  const handleScriptUploaded = (newSegments) => {
+  const handleScriptUploaded = (newSegments, newSessionId) => {
     setSegments(newSegments);
+    setSessionId(newSessionId);
     setUploadStatus({ ...uploadStatus, script: true });
   };
 
@@ -24,13 +26,17 @@ function App() {
           <Route path="/" element={<HomePage />} />
           <Route 
             path="/scripts" 
-            element={<ScriptsPage onScriptUploaded={handleScriptUploaded} />} 
+            element={<ScriptsPage
+                sessionId={sessionId}
+                onSessionChange={setSessionId}
+                onScriptUploaded={handleScriptUploaded}
+              />} 
           />
           <Route 
             path="/teleprompter" 
-            element={<TeleprompterPage segments={segments} />} 
+            element={<TeleprompterPage segments={segments} sessionId={sessionId} />} 
           />
-          <Route path="/qa" element={<QAPage />} />
+          <Route path="/qa" element={<QAPage sessionId={sessionId} />} />
           <Route path="/settings" element={<SettingsPage />} />
           <Route path="*" element={<Navigate to="/" replace />} />
         </Routes>
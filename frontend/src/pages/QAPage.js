@@ -15,7 +15,24 @@ const getBackendUrl = () => {
   return 'https://smart-teleprompter-production.up.railway.app';
 };
 
-const QAPage = () => {
+// 解析 SSE 文本块：返回完整事件列表与未完成的剩余部分
+const parseSSE = (buffer) => {
+  const events = [];
+  const frames = buffer.split('\n\n');
+  const rest = frames.pop();
+  frames.forEach((frame) => {
+    let event = 'message';
+    let data = '';
+    frame.split('\n').forEach((line) => {
+      if (line.startsWith('event: ')) event = line.slice(7);
+      else if (line.startsWith('data: ')) data += line.slice(6);
+    });
+    if (data) events.push({ event, data: JSON.parse(data) });
+  });
+  return { events, rest };
+};
+
+const QAPage = ({ sessionId }) => {
   const [question, setQuestion] = useState('');
   const [answer, setAnswer] = useState('');
   const [loading, setLoading] = useState(false);
@@ -31,19 +48,41 @@ const QAPage = () => {
     setLoading(true);
     setError('');
     setAnswer('');
+    setHasSkippedContent(false);
 
     try {
-      const res = await fetch(`${getBackendUrl()}/ask_qa?question=${encodeURIComponent(question)}`, {
+      const sessionParam = sessionId ? `&session_id=${encodeURIComponent(sessionId)}` : '';
+      // 流式接口：回答逐段显示，无需等待整段生成
+      const res = await fetch(`${getBackendUrl()}/ask_qa/stream?question=${encodeURIComponent(question)}${sessionParam}`, {
         method: 'POST'
       });
-      
-      const data = await res.json();
-      
-      if (data.success) {
-        setAnswer(data.answer);
-        setHasSkippedContent(data.has_skipped_content);
-      } else {
+
+      if (!res.ok) {
+        const data = await res.json();
         setError(data.detail || 'AI 回答失败');
+        return;
+      }
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const { events, rest } = parseSSE(buffer);
+        buffer = rest;
+        events.forEach(({ event, data }) => {
+          if (event === 'meta') {
+            setHasSkippedContent(data.has_skipped_content);
+          } else if (event === 'token') {
+            setAnswer((prev) => prev + data.text);
+          } else if (event === 'error') {
+            setError(data.detail || 'AI 回答失败');
+          } else if (event === 'done') {
+            console.log(`Q&A 首字 ${data.ttft_ms}ms，总耗时 ${data.total_ms}ms`);
+          }
+        });
       }
     } catch (err) {
       setError('网络错误，请检查后端服务是否运行');
@@ -117,8 +156,8 @@ const QAPage = () => {
           </div>
         )}
 
-        {/* 回答区域 */}
-        {answer && (
+        {/* 回答区域：收到 meta 后即显示跳过提醒，回答逐段追加 */}
+        {(answer || (loading && hasSkippedContent)) && (
           <div className="qa-answer-section">
             <div className="answer-header">
               <span className="answer-icon">✨</span>
@@ -16,11 +16,45 @@ const getBackendUrl = () => {
   return 'https://smart-teleprompter-production.up.railway.app';
 };
 
-const ScriptsPage = ({ onScriptUploaded }) => {
+// 携带会话 ID，使演讲稿与 PPT 归属同一会话
+const withSession = (url, sessionId) =>
+  sessionId ? `${url}?session_id=${encodeURIComponent(sessionId)}` : url;
+
+// 后台任务轮询间隔（毫秒）
+const JOB_POLL_INTERVAL = 1500;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const ScriptsPage = ({ sessionId, onSessionChange, onScriptUploaded }) => {
   const navigate = useNavigate();
   const [uploading, setUploading] = useState(false);
   const [error, setError] = useState('');
   const [pptUploading, setPptUploading] = useState(false);
+  const [pptProgress, setPptProgress] = useState('');
+
+  // 轮询后台分析任务直到完成或失败，期间显示进度
+  const waitForJob = async (jobId) => {
+    let since = 0;
+    while (true) {
+      const res = await fetch(`${getBackendUrl()}/jobs/${jobId}?since=${since}`);
+      const job = await res.json();
+      if (!res.ok) {
+        throw new Error(job.detail || '任务不存在');
+      }
+      since = job.next_since;
+
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') throw new Error(job.error || '分析失败');
+
+      const { done, total } = job.progress;
+      setPptProgress(
+        job.status === 'queued'
+          ? `排队中（前面 ${job.queue_position} 个）`
+          : total ? `分析中 ${done}/${total}` : '分析中...'
+      );
+      await sleep(JOB_POLL_INTERVAL);
+    }
+  };
 
   const handleScriptUpload = async (e) => {
     const file = e.target.files[0];
@@ -33,7 +67,7 @@ const ScriptsPage = ({ onScriptUploaded }) => {
     formData.append('file', file);
 
     try {
-      const res = await fetch(`${getBackendUrl()}/upload_script`, {
+      const res = await fetch(withSession(`${getBackendUrl()}/upload_script`, sessionId), {
         method: 'POST',
         body: formData
       });
@@ -41,7 +75,7 @@ const ScriptsPage = ({ onScriptUploaded }) => {
       const data = await res.json();
 
       if (data.success) {
-        onScriptUploaded(data.segments);
+        onScriptUploaded(data.segments, data.session_id);
         navigate('/teleprompter');
       } else {
         setError(data.detail || '上传失败');
@@ -58,13 +92,14 @@ const ScriptsPage = ({ onScriptUploaded }) => {
     if (!file) return;
 
     setPptUploading(true);
+    setPptProgress('上传中...');
     setError('');
 
     const formData = new FormData();
     formData.append('file', file);
 
     try {
-      const res = await fetch(`${getBackendUrl()}/upload_ppt`, {
+      const res = await fetch(withSession(`${getBackendUrl()}/upload_ppt`, sessionId), {
         method: 'POST',
         body: formData
       });
@@ -72,14 +107,17 @@ const ScriptsPage = ({ onScriptUploaded }) => {
       const data = await res.json();
 
       if (data.success) {
-        alert('PPT 上传成功！');
+        onSessionChange(data.session_id);
+        await waitForJob(data.job_id);
+        alert('PPT 分析完成！');
       } else {
         setError(data.detail || 'PPT 上传失败');
       }
     } catch (err) {
-      setError('PPT 上传失败，请检查网络');
+      setError(err.message ? `PPT 处理失败：${err.message}` : 'PPT 上传失败，请检查网络');
     } finally {
       setPptUploading(false);
+      setPptProgress('');
     }
   };
 
@@ -115,7 +153,7 @@ const ScriptsPage = ({ onScriptUploaded }) => {
           <h3>上传 PPT</h3>
           <p>支持 PDF 格式</p>
           <label className="upload-btn">
-            {pptUploading ? '分析中...' : '选择文件'}
+            {pptUploading ? (pptProgress || '分析中...') : '选择文件'}
             <input
               type="file"
               accept=".pdf"
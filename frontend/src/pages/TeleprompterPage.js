@@ -25,7 +25,35 @@ const getWebSocketUrl = () => {
   return 'wss://smart-teleprompter-production.up.railway.app';
 };
 
-const TeleprompterPage = ({ segments: initialSegments }) => {
+// 二进制 delta 解码（布局见后端 ws_codec.py，小端序）
+const STATUS_NAMES = ['pending', 'covered', 'skipped', 'current'];
+const DELTA_HEADER_BYTES = 16;
+
+const decodeDelta = (buffer) => {
+  const view = new DataView(buffer);
+  const flags = view.getUint8(1);
+  const count = view.getUint16(2, true);
+  const statusOffset = DELTA_HEADER_BYTES + count * 4;
+  const changes = [];
+  for (let i = 0; i < count; i++) {
+    changes.push({
+      id: view.getInt32(DELTA_HEADER_BYTES + i * 4, true),
+      status: STATUS_NAMES[view.getUint8(statusOffset + i)]
+    });
+  }
+  const data = {
+    type: 'delta',
+    current_idx: view.getInt32(4, true),
+    base_version: view.getUint32(8, true),
+    version: view.getUint32(12, true),
+    is_free_style: (flags & 1) !== 0,
+    changes
+  };
+  if (flags & 2) data.matched = (flags & 4) !== 0;
+  return data;
+};
+
+const TeleprompterPage = ({ segments: initialSegments, sessionId }) => {
   const [segments, setSegments] = useState(initialSegments || []);
   const [currentIdx, setCurrentIdx] = useState(-1);
   const [isFreeStyle, setIsFreeStyle] = useState(false);
@@ -34,7 +62,9 @@ const TeleprompterPage = ({ segments: initialSegments }) => {
   
   const scrollRef = useRef([]);
   const ws = useRef(null);
+  const versionRef = useRef(null);
   const recognition = useRef(null);
+  const recognitionRun = useRef(0);
 
   // WebSocket连接
   useEffect(() => {
@@ -46,23 +76,60 @@ const TeleprompterPage = ({ segments: initialSegments }) => {
         return;
       }
       
-      console.log('连接 WebSocket:', `${wsUrl}/ws/speech`);
+      // 位置更新使用二进制帧（不支持的旧服务端会忽略该参数，继续发送 JSON）
+      const endpoint = sessionId
+        ? `${wsUrl}/ws/speech?encoding=binary&session_id=${encodeURIComponent(sessionId)}`
+        : `${wsUrl}/ws/speech?encoding=binary`;
+      console.log('连接 WebSocket:', endpoint);
       
       try {
-        ws.current = new WebSocket(`${wsUrl}/ws/speech`);
+        ws.current = new WebSocket(endpoint);
+        ws.current.binaryType = 'arraybuffer';
         
         ws.current.onopen = () => {
           console.log('✅ WebSocket 已连接');
         };
         
         ws.current.onmessage = (event) => {
-          const data = JSON.parse(event.data);
-          console.log('收到消息:', data);
-          if (!data.error) {
+          const data = typeof event.data === 'string'
+            ? JSON.parse(event.data)
+            : decodeDelta(event.data);
+          if (data.error) {
+            console.error('❌ 服务端错误:', data.error);
+            return;
+          }
+          
+          // 心跳：回应服务端 ping，忽略 pong
+          if (data.type === 'ping') {
+            ws.current.send(JSON.stringify({ type: 'pong', t: data.t }));
+            return;
+          }
+          if (data.type === 'pong') return;
+          
+          if (data.type === 'delta') {
+            // 增量更新：版本不连续时请求重新同步
+            if (data.base_version !== versionRef.current) {
+              console.warn('版本不一致，请求重新同步');
+              ws.current.send(JSON.stringify({ type: 'resync' }));
+              return;
+            }
+            if (data.changes.length > 0) {
+              setSegments(prev => {
+                const next = prev.slice();
+                data.changes.forEach(({ id, status }) => {
+                  if (next[id]) next[id] = { ...next[id], status };
+                });
+                return next;
+              });
+            }
+          } else {
+            // 完整快照（连接时或重新同步时）
             setSegments(data.segments);
-            setCurrentIdx(data.current_idx);
-            setIsFreeStyle(data.is_free_style);
           }
+          
+          versionRef.current = data.version;
+          setCurrentIdx(data.current_idx);
+          setIsFreeStyle(data.is_free_style);
         };
         
         ws.current.onerror = (error) => {
@@ -78,7 +145,7 @@ const TeleprompterPage = ({ segments: initialSegments }) => {
         console.error('❌ WebSocket 连接失败:', error);
       }
     }
-  }, [segments.length]);
+  }, [segments.length, sessionId]);
 
   // 自动滚动
   useEffect(() => {
@@ -104,24 +171,35 @@ const TeleprompterPage = ({ segments: initialSegments }) => {
       const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
       recognition.current = new SpeechRecognition();
       recognition.current.continuous = true;
-      recognition.current.interimResults = false;
+      // 开启中间结果：边说边发送，后端按 utterance_id 合并，只匹配每句话的最新文本
+      recognition.current.interimResults = true;
       
       // 从设置中读取语言配置
       const savedLang = localStorage.getItem('setting_speechLanguage') || 'zh-CN';
       recognition.current.lang = savedLang;
       console.log('🌍 语音识别语言:', savedLang);
 
+      // 每次启动识别时 results 下标从 0 开始，用启动次数区分不同轮次的 utterance
+      recognition.current.onstart = () => {
+        recognitionRun.current += 1;
+      };
+
       recognition.current.onresult = (event) => {
-        const last = event.results.length - 1;
-        const text = event.results[last][0].transcript;
-        
-        console.log('🎤 识别到:', text);
-        
-        if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-          console.log('📤 发送到后端:', text);
-          ws.current.send(JSON.stringify({ text }));
-        } else {
+        if (!ws.current || ws.current.readyState !== WebSocket.OPEN) {
           console.error('❌ WebSocket 未连接，无法发送');
+          return;
+        }
+
+        for (let i = event.resultIndex; i < event.results.length; i++) {
+          const result = event.results[i];
+          const text = result[0].transcript;
+          if (result.isFinal) console.log('🎤 识别到:', text);
+
+          ws.current.send(JSON.stringify({
+            text,
+            utterance_id: `${recognitionRun.current}-${i}`,
+            is_final: result.isFinal
+          }));
         }
       };
 